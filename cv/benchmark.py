@@ -0,0 +1,273 @@
+"""
+Latency benchmarks for the proctoring pipeline stages
+
+Times each stage on recorded fixture frames and their serialized FaceMesh
+landmarks, so no webcam is needed:
+
+    jpeg_decode, mirror_bgr2rgb, facemesh_process, frame_context,
+    head_tilt_pose, mouth_state, eye_gaze, cheating_score,
+    cheating_score_batch (one frame for each of 256 sessions via ScoringEngine),
+    flask_process_frame (raw JPEG and base64 JSON through the test client)
+    and ProctorSystem.process_frame from main.py
+
+The Flask stages post the same frame repeatedly, so motion gating, face-ROI
+cropping and the per-frame metrics log are switched off for them; otherwise
+every iteration after the first would time the reused-metrics shortcut.
+
+The landmark fixtures in bench_fixtures/ are checked in so baselines from
+different machines time the same landmarks; --record regenerates them.
+
+Reports p50/p95/p99 latency and frames/sec per stage. --save writes the
+results as a JSON baseline; --compare flags stages that regressed against
+one.
+
+Usage:
+    python benchmark.py --save benchmark_baseline.json
+    python benchmark.py --compare benchmark_baseline.json
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+from g_helper import bgr2rgb, mirrorImage
+from fp_helper import pipelineHeadTiltPose
+from ms_helper import pipelineMouthState
+from eg_helper import pipelineEyeGaze
+from frame_context import FrameContext
+from mesh_pool import FACE_MESH_OPTIONS, mp_face_mesh
+
+DEFAULT_FRAMES = ['reference.jpeg']
+DEFAULT_LANDMARKS = 'bench_fixtures/landmarks.json'
+
+# cheating_detector settings for the Flask stages: no motion gate, no ROI crop, no frame log
+FLASK_BENCH_SETTINGS = {'MOTION_GATE_MAX_SKIP': 0, 'ROI_CROP_SIZE': 0, 'FRAME_STORE_DIR': None}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, int(np.ceil(pct / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def time_stage(fn, iterations, warmup):
+    """Call fn repeatedly and return latency statistics in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    mean_ns = sum(samples) / len(samples)
+    return {
+        'iterations': iterations,
+        'p50_ms': percentile(samples, 50) / 1e6,
+        'p95_ms': percentile(samples, 95) / 1e6,
+        'p99_ms': percentile(samples, 99) / 1e6,
+        'mean_ms': mean_ns / 1e6,
+        'fps': 1e9 / mean_ns if mean_ns else float('inf'),
+    }
+
+
+def record_landmarks(frame_paths, landmarks_path):
+    """Run FaceMesh once over the fixture frames and serialize the landmarks"""
+    fixtures = []
+    with mp_face_mesh.FaceMesh(**dict(FACE_MESH_OPTIONS, static_image_mode=True)) as face_mesh:
+        for path in frame_paths:
+            frame = mirrorImage(cv2.imread(path))
+            results = face_mesh.process(bgr2rgb(frame))
+            faces = [[[lm.x, lm.y, lm.z] for lm in face.landmark]
+                     for face in (results.multi_face_landmarks or [])]
+            fixtures.append({'image': path, 'shape': list(frame.shape), 'faces': faces})
+    os.makedirs(os.path.dirname(landmarks_path) or '.', exist_ok=True)
+    with open(landmarks_path, 'w') as f:
+        json.dump({'frames': fixtures}, f)
+    return fixtures
+
+
+def load_landmarks(fixture):
+    """Rebuild MediaPipe landmark lists from a serialized fixture"""
+    faces = []
+    for points in fixture['faces']:
+        landmark_list = landmark_pb2.NormalizedLandmarkList()
+        for x, y, z in points:
+            landmark_list.landmark.add(x=x, y=y, z=z)
+        faces.append(landmark_list)
+    return faces
+
+
+def run_benchmarks(fixtures, iterations, warmup, stages=None):
+    """Time every stage on the first fixture frame with a face"""
+    fixture = next((f for f in fixtures if f['faces']), None)
+    if fixture is None:
+        raise ValueError("No fixture frame contains a face")
+    with open(fixture['image'], 'rb') as f:
+        jpeg_bytes = f.read()
+    frame = mirrorImage(cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR))
+    rgb_frame = bgr2rgb(frame)
+    face_landmarks = load_landmarks(fixture)[0]
+    ctx = FrameContext(face_landmarks, frame.shape)
+
+    benches = {}
+    benches['jpeg_decode'] = lambda: cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+    benches['mirror_bgr2rgb'] = lambda: bgr2rgb(mirrorImage(frame))
+
+    face_mesh = mp_face_mesh.FaceMesh(**FACE_MESH_OPTIONS)
+    benches['facemesh_process'] = lambda: face_mesh.process(rgb_frame)
+
+    benches['frame_context'] = lambda: FrameContext(face_landmarks, frame.shape)
+    benches['head_tilt_pose'] = lambda: pipelineHeadTiltPose(frame, ctx, draw=False)
+    benches['mouth_state'] = lambda: pipelineMouthState(frame, ctx, draw=False)
+    benches['eye_gaze'] = lambda: pipelineEyeGaze(frame, ctx, draw=False)
+    overlay = frame.copy()
+    benches['analyzers_with_overlays'] = lambda: (pipelineHeadTiltPose(overlay, ctx, draw=True),
+                                                  pipelineMouthState(overlay, ctx, draw=True),
+                                                  pipelineEyeGaze(overlay, ctx, draw=True))
+
+    import cheating_detector
+    detector = cheating_detector.CheatingDetector()
+    gaze_info = pipelineEyeGaze(frame, ctx, draw=False)
+    head_tilt_pose = pipelineHeadTiltPose(frame, ctx, draw=False)
+    mouth_state = pipelineMouthState(frame, ctx, draw=False)
+    benches['cheating_score'] = lambda: detector.calculate_cheating_score(gaze_info, head_tilt_pose, mouth_state)
+    
+    from scoring_engine import ScoringEngine
+    engine = ScoringEngine(capacity=256)
+    batch_detectors = [cheating_detector.CheatingDetector(engine=engine) for _ in range(256)]
+    for batch_detector in batch_detectors:
+        batch_detector.update_face_presence(1)
+    batch_args = ([gaze_info] * 256, [head_tilt_pose] * 256, [mouth_state] * 256)
+    benches['cheating_score_batch'] = lambda: cheating_detector.calculate_cheating_scores(
+        batch_detectors, *batch_args)
+
+    # Full inference on every request (see the module docstring)
+    saved_settings = {name: getattr(cheating_detector, name) for name in FLASK_BENCH_SETTINGS}
+    for name, value in FLASK_BENCH_SETTINGS.items():
+        setattr(cheating_detector, name, value)
+    client = cheating_detector.app.test_client()
+    bench_headers = {'X-Session-ID': 'benchmark'}
+    benches['flask_process_frame'] = lambda: client.post(
+        '/process-frame', data=jpeg_bytes, content_type='image/jpeg', headers=bench_headers)
+    json_body = {'frame': 'data:image/jpeg;base64,' + base64.b64encode(jpeg_bytes).decode('ascii')}
+    benches['flask_process_frame_json'] = lambda: client.post(
+        '/process-frame', json=json_body, headers=bench_headers)
+
+    proctor_dir = tempfile.mkdtemp(prefix='proctor_bench_')
+    proctor = make_proctor(proctor_dir)
+    if proctor is not None:
+        raw_frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+        benches['proctor_process_frame'] = lambda: proctor.process_frame(raw_frame.copy())
+
+    results = {}
+    try:
+        for name, fn in benches.items():
+            if stages and name not in stages:
+                continue
+            results[name] = time_stage(fn, iterations, warmup)
+    finally:
+        for name, value in saved_settings.items():
+            setattr(cheating_detector, name, value)
+        face_mesh.close()
+        if proctor is not None:
+            proctor.event_writer.close()
+            proctor.evidence_writer.close()
+        shutil.rmtree(proctor_dir, ignore_errors=True)
+    return results
+
+
+def make_proctor(sessions_dir):
+    """
+    Build a verified ProctorSystem for benchmarking, or None if its models
+    are unavailable
+
+    Its event log and suspicious frames go to sessions_dir, and identity
+    re-verification is off so no timed frame pays for a face embedding.
+    """
+    try:
+        from main import ProctorSystem
+        proctor = ProctorSystem('reference.jpeg', session_id='benchmark', reverify_interval=0,
+                                sessions_dir=sessions_dir)
+    except Exception as e:  # dlib predictor or face_recognition models missing
+        print(f"Skipping proctor_process_frame: {e}")
+        return None
+    proctor.verified = True  # Benchmark the monitoring path, not the one-time check
+    return proctor
+
+
+def print_results(results, baseline=None, tolerance=0.1):
+    """Print a results table; with a baseline, mark p50 regressions beyond tolerance"""
+    regressions = []
+    print(f"{'stage':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'fps':>10}{'vs base':>10}")
+    for name, stats in results.items():
+        line = f"{name:<28}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['fps']:>10.1f}"
+        base = (baseline or {}).get(name)
+        if base:
+            change = stats['p50_ms'] / base['p50_ms'] - 1.0
+            line += f"{change:>+10.1%}"
+            if change > tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the proctoring pipeline stages')
+    parser.add_argument('--frames', nargs='+', default=DEFAULT_FRAMES,
+                        help='Fixture frames (default: reference.jpeg)')
+    parser.add_argument('--landmarks', type=str, default=DEFAULT_LANDMARKS,
+                        help=f'Serialized landmark fixtures (default: {DEFAULT_LANDMARKS})')
+    parser.add_argument('--record', action='store_true',
+                        help='Re-record the landmark fixtures from the fixture frames')
+    parser.add_argument('--iterations', '-n', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--stages', nargs='+', default=None, help='Only run these stages')
+    parser.add_argument('--save', type=str, default=None, help='Write results to this JSON baseline')
+    parser.add_argument('--compare', type=str, default=None, help='Compare against this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed p50 slowdown before a stage is flagged (default: 0.1 = 10%%)')
+    args = parser.parse_args()
+
+    if args.record or not os.path.exists(args.landmarks):
+        print(f"Recording landmark fixtures to {args.landmarks}")
+        fixtures = record_landmarks(args.frames, args.landmarks)
+    else:
+        with open(args.landmarks) as f:
+            fixtures = json.load(f)['frames']
+
+    results = run_benchmarks(fixtures, args.iterations, args.warmup, args.stages)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['stages']
+    regressions = print_results(results, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                            'opencv': cv2.__version__, 'cpus': os.cpu_count()},
+                'iterations': args.iterations,
+                'stages': results,
+            }, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if regressions:
+        print(f"Regressed stages: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
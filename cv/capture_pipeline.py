@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from frame_slot import LatestFrameSlot
+
+
+class FpsMeter:
+    """Events per second over a sliding time window"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.count = 0
+        self._stamps = deque()
+        self._lock = threading.Lock()
+
+    def tick(self):
+        now = time.monotonic()
+        with self._lock:
+            self.count += 1
+            self._stamps.append(now)
+            while now - self._stamps[0] > self.window:
+                self._stamps.popleft()
+
+    @property
+    def fps(self):
+        with self._lock:
+            if len(self._stamps) < 2:
+                return 0.0
+            span = self._stamps[-1] - self._stamps[0]
+            return (len(self._stamps) - 1) / span if span > 0 else 0.0
+
+
+class CapturePipeline:
+    """
+    Capture -> analysis -> display, each stage on its own thread
+
+    The capture thread reads the camera as fast as it delivers and parks
+    each frame in a LatestFrameSlot, so the driver queue never fills with
+    stale frames. The analysis thread always takes the newest frame, and
+    the display loop (on the calling thread, as OpenCV GUIs require) shows
+    the newest analyzed frame. Frames arriving while analysis is busy are
+    dropped, not queued.
+
+    Args:
+        cap: Opened cv2.VideoCapture
+        process: Callable(frame) -> (annotated_frame, keep_running)
+        window_name: Title of the display window
+        show_fps: Draw the capture/analysis rates on the displayed frame
+    """
+
+    def __init__(self, cap, process, window_name='Proctoring System', show_fps=True):
+        self.cap = cap
+        self.process = process
+        self.window_name = window_name
+        self.show_fps = show_fps
+        self.capture_fps = FpsMeter()
+        self.analysis_fps = FpsMeter()
+        self.error = None
+        self._frames = LatestFrameSlot()
+        self._results = LatestFrameSlot()
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+        self._frames.close()
+        self._results.close()
+
+    def run(self):
+        """Run until 'q' is pressed, the camera fails or process() asks to stop"""
+        threads = [threading.Thread(target=self._capture, name='capture', daemon=True),
+                   threading.Thread(target=self._analyze, name='analysis', daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = self._results.get(timeout=0.05)
+                if item is not None:
+                    _, frame = item
+                    if self.show_fps:
+                        cv2.putText(frame, self.fps_text(), (10, frame.shape[0] - 40),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+                    cv2.imshow(self.window_name, frame)
+                elif self._results.closed:
+                    break
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+        return self.error
+
+    def fps_text(self):
+        return (f"Capture {self.capture_fps.fps:.1f} fps | "
+                f"Analysis {self.analysis_fps.fps:.1f} fps | dropped {self._frames.dropped}")
+
+    def _capture(self):
+        while not self._stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                self.error = "Failed to grab frame."
+                break
+            self.capture_fps.tick()
+            self._frames.put(frame)
+        self._frames.close()
+
+    def _analyze(self):
+        try:
+            while True:
+                item = self._frames.get()
+                if item is None:
+                    break
+                _, frame = item
+                processed_frame, keep_running = self.process(frame)
+                self.analysis_fps.tick()
+                self._results.put(processed_frame)
+                if not keep_running:
+                    break
+        except Exception as e:
+            self.error = f"Analysis failed: {e}"
+        finally:
+            # Display shows the last result, then the loop ends
+            self._stop.set()
+            self._results.close()
@@ -7,9 +7,12 @@ from datetime import datetime
 import os
 import face_recognition
 import base64
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+import hashlib
 import json
+import re
+import threading
 
 mp_drawing = mp.solutions.drawing_utils
 mp_drawing_styles = mp.solutions.drawing_styles
@@ -19,29 +22,40 @@ from g_helper import bgr2rgb, rgb2bgr, mirrorImage
 from fp_helper import pipelineHeadTiltPose, draw_face_landmarks_fp
 from ms_helper import pipelineMouthState
 from eg_helper import pipelineEyeGaze
+from eg_batch import batchEyeGaze, gazeInfoList, stackContexts
+from frame_context import FrameContext
+from mesh_pool import FaceMeshPool, MeshPoolExhausted
+from session_registry import SessionRegistry
+from frame_slot import LatestFrameSlot
+from metrics import MetricsRegistry
+from motion_gate import MotionGate
+from face_roi import FaceRoiTracker
+from encoding_cache import default_cache, load_reference_encoding
+from reverify import ReVerifier
+from identity_gallery import IdentityGallery
+from file_lock import file_lock
+from streaming_stats import StreamingStats
+from scoring_engine import (ScoringEngine, ScoreBatcher, SCORING_WEIGHTS, SUSPICIOUS_GAZE, SUSPICIOUS_HEAD_TILT,
+                            SUSPICIOUS_MOUTH, HISTORY_WINDOW, STATUS_THRESHOLDS, STATUS_DEFAULT)
+from frame_store import FrameStoreWriter, frame_record
+
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:  # WebSocket streaming is optional
+    Sock = None
 
 class FaceVerifier:
-    def __init__(self, reference_image_path):
+    def __init__(self, reference_image_path, encoding_cache=None, reference_encoding=None):
         self.reference_image_path = reference_image_path
-        self.reference_encoding = None
-        self.load_reference_face()
+        self.encoding_cache = encoding_cache
+        self.reference_encoding = reference_encoding
+        if self.reference_encoding is None:
+            self.load_reference_face()
         
     def load_reference_face(self):
-        """Load and process the reference face image"""
-        if not os.path.exists(self.reference_image_path):
-            raise FileNotFoundError(f"Reference image not found at {self.reference_image_path}")
-            
-        # Load reference image
-        ref_image = face_recognition.load_image_file(self.reference_image_path)
-        
-        # Get face encodings
-        face_encodings = face_recognition.face_encodings(ref_image)
-        
-        if len(face_encodings) == 0:
-            raise ValueError("No face detected in reference image")
-            
-        # Store the first face encoding
-        self.reference_encoding = face_encodings[0]
+        """Load the reference face encoding, computing it only on a cache miss"""
+        self.reference_encoding = load_reference_encoding(self.reference_image_path, self.encoding_cache)
         
     def verify_face(self, frame):
         """Verify if the face in the frame matches the reference face"""
@@ -122,8 +136,24 @@ def verify_identity(cap, reference_image_path):
     cv2.destroyWindow('Identity Verification')
     return verified
 
+# BGR overlay color of each status
+STATUS_COLORS = {
+    "HIGH RISK": (0, 0, 255),  # Red
+    "MEDIUM RISK": (0, 165, 255),  # Orange
+    "LOW RISK": (0, 255, 255),  # Yellow
+    "SAFE": (0, 255, 0),  # Green
+}
+
 class CheatingDetector:
-    def __init__(self):
+    def __init__(self, engine=None):
+        """
+        Args:
+            engine: Optional ScoringEngine holding this detector's smoothing
+                windows, so it can be scored in batches with other sessions
+        """
+        self.engine = engine
+        self.engine_slot = engine.allocate() if engine is not None else None
+        
         self.face_detected = False
         self.last_face_time = time.time()
         self.face_absence_start = None
@@ -132,7 +162,8 @@ class CheatingDetector:
         
         # Session tracking
         self.session_start_time = time.time()
-        self.session_scores = []
+        # Streaming score aggregates: constant memory however long the session
+        self.session_scores = StreamingStats(bins=100, lo=0.0, hi=1.0, quantiles=(0.5, 0.95))
         self.high_risk_count = 0
         self.medium_risk_count = 0
         self.low_risk_count = 0
@@ -140,23 +171,22 @@ class CheatingDetector:
         self.multiple_faces_count = 0
         self.face_absence_count = 0
         
-        # Scoring weights
-        self.weights = {
-            'eye_gaze': 0.4,
-            'head_tilt': 0.3,
-            'mouth_movement': 0.2,
-            'face_presence': 0.1
-        }
+        # Scoring weights (shared with ScoringEngine)
+        self.weights = dict(SCORING_WEIGHTS)
+        
+        # Smoothed component scores of the last scored frame
+        # (eye_gaze, head_tilt, mouth_movement, face_presence)
+        self.last_components = (0.0, 0.0, 0.0, 0.0)
         
         # History for smoothing
-        self.gaze_history = deque(maxlen=10)
-        self.head_tilt_history = deque(maxlen=10)
-        self.mouth_history = deque(maxlen=10)
+        self.gaze_history = deque(maxlen=HISTORY_WINDOW)
+        self.head_tilt_history = deque(maxlen=HISTORY_WINDOW)
+        self.mouth_history = deque(maxlen=HISTORY_WINDOW)
         
-        # Suspicious patterns
-        self.suspicious_gaze = ['Left', 'Right', 'Up', 'Down']
-        self.suspicious_head_tilt = ['Left', 'Right', 'Up', 'Down']
-        self.suspicious_mouth = ['Open', 'Talking']
+        # Suspicious patterns (shared with ScoringEngine)
+        self.suspicious_gaze = list(SUSPICIOUS_GAZE)
+        self.suspicious_head_tilt = list(SUSPICIOUS_HEAD_TILT)
+        self.suspicious_mouth = list(SUSPICIOUS_MOUTH)
         
     def calculate_eye_gaze_score(self, gaze_info):
         """Calculate score based on eye gaze"""
@@ -198,9 +228,9 @@ class CheatingDetector:
         else:
             return 0.0
             
-    def update_face_presence(self, num_faces):
-        """Update face presence tracking"""
-        current_time = time.time()
+    def update_face_presence(self, num_faces, now=None):
+        """Update face presence tracking; now defaults to the current time"""
+        current_time = time.time() if now is None else now
         
         if num_faces == 0:
             if self.face_detected:
@@ -223,6 +253,9 @@ class CheatingDetector:
             
     def calculate_cheating_score(self, gaze_info, head_tilt, mouth_state):
         """Calculate overall cheating score"""
+        if self.engine is not None:
+            return calculate_cheating_scores([self], [gaze_info], [head_tilt], [mouth_state])[0]
+            
         # Update histories
         self.gaze_history.append(self.calculate_eye_gaze_score(gaze_info))
         self.head_tilt_history.append(self.calculate_head_tilt_score(head_tilt))
@@ -234,6 +267,9 @@ class CheatingDetector:
         avg_mouth_score = sum(self.mouth_history) / len(self.mouth_history)
         face_score = self.calculate_face_presence_score()
         
+        # Kept for per-frame metrics output
+        self.last_components = (avg_gaze_score, avg_head_score, avg_mouth_score, face_score)
+        
         # Calculate weighted score
         total_score = (
             avg_gaze_score * self.weights['eye_gaze'] +
@@ -246,18 +282,14 @@ class CheatingDetector:
         
     def get_cheating_status(self, score):
         """Get cheating status based on score"""
-        if score >= 0.8:
-            return "HIGH RISK", (0, 0, 255)  # Red
-        elif score >= 0.5:
-            return "MEDIUM RISK", (0, 165, 255)  # Orange
-        elif score >= 0.3:
-            return "LOW RISK", (0, 255, 255)  # Yellow
-        else:
-            return "SAFE", (0, 255, 0)  # Green
+        for threshold, status in STATUS_THRESHOLDS:
+            if score >= threshold:
+                return status, STATUS_COLORS[status]
+        return STATUS_DEFAULT, STATUS_COLORS[STATUS_DEFAULT]
 
     def update_session_stats(self, score, status, multiple_faces=False, face_absent=False):
         """Update session statistics"""
-        self.session_scores.append(score)
+        self.session_scores.add(score)
         
         if status == "HIGH RISK":
             self.high_risk_count += 1
@@ -273,16 +305,28 @@ class CheatingDetector:
         if face_absent:
             self.face_absence_count += 1
             
-    def get_session_summary(self):
-        """Get session summary statistics"""
-        session_duration = time.time() - self.session_start_time
+    def close(self):
+        """Return the ScoringEngine slot, if any; later frames are scored unbatched"""
+        if self.engine is not None and self.engine_slot is not None:
+            self.engine.release(self.engine_slot)
+            self.engine_slot = None
+            self.engine = None
+            
+    def get_session_summary(self, duration=None):
+        """Get session summary statistics; duration overrides the wall-clock session length"""
+        session_duration = time.time() - self.session_start_time if duration is None else duration
         total_frames = len(self.session_scores)
         
         if total_frames == 0:
             return "No data collected during session."
             
-        avg_score = sum(self.session_scores) / total_frames
-        max_score = max(self.session_scores)
+        avg_score = self.session_scores.mean
+        max_score = self.session_scores.max
+        p50_score = self.session_scores.quantile(0.5)
+        p95_score = self.session_scores.quantile(0.95)
+        score_distribution = "\n".join(
+            f"- {lower:.1f}-{upper:.1f}: {count} frames ({count / total_frames * 100:.1f}%)"
+            for lower, upper, count in self.session_scores.distribution(10))
         
         # Calculate percentages
         total_risky_frames = self.high_risk_count + self.medium_risk_count
@@ -323,137 +367,856 @@ Incidents:
 Statistics:
 - Average Risk Score: {avg_score:.2f}
 - Maximum Risk Score: {max_score:.2f}
+- Median Risk Score (p50): {p50_score:.2f}
+- 95th Percentile Risk Score (p95): {p95_score:.2f}
 - Risky Behavior: {risky_percentage:.1f}% of session
 
+Score Distribution:
+{score_distribution}
+
 Final Score: {final_score}/100
 Final Verdict: {verdict}
 """
         return summary
 
+def calculate_cheating_scores(detectors, gaze_infos, head_tilts, mouth_states):
+    """
+    calculate_cheating_score for several detectors sharing one ScoringEngine,
+    in a single vectorized step
+    
+    Returns:
+        List of scores, identical to the per-detector computation
+    """
+    engine = detectors[0].engine
+    components = engine.encode(gaze_infos, head_tilts, mouth_states)
+    face_scores = [detector.calculate_face_presence_score() for detector in detectors]
+    totals, averages = engine.score([detector.engine_slot for detector in detectors],
+                                    components, face_scores)
+    for detector, (gaze, head, mouth), face in zip(detectors, averages.tolist(), face_scores):
+        detector.last_components = (gaze, head, mouth, face)
+    return totals.tolist()
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Global detector instance
-detector = None
+# Long-lived FaceMesh graphs, one per session, so tracking carries across frames
+mesh_pool = FaceMeshPool(
+    max_instances=int(os.environ.get('FACE_MESH_MAX_INSTANCES', 32)),
+    idle_timeout=float(os.environ.get('FACE_MESH_IDLE_TIMEOUT', 120)),
+)
+
+# Separate graphs for face-ROI crops, so neither graph's tracking state is
+# carried between crop and full-frame coordinates. Capped on their own: the
+# live FaceMesh graphs total at most FACE_MESH_MAX_INSTANCES + ROI_MESH_MAX_INSTANCES
+roi_mesh_pool = FaceMeshPool(
+    max_instances=int(os.environ.get('ROI_MESH_MAX_INSTANCES', 32)),
+    idle_timeout=float(os.environ.get('FACE_MESH_IDLE_TIMEOUT', 120)),
+)
+
+def release_meshes(session_id):
+    """Close both FaceMesh graphs owned by a session"""
+    mesh_pool.release(session_id)
+    roi_mesh_pool.release(session_id)
+
+# Every live session's smoothing windows sit in one ScoringEngine; concurrent
+# requests from different sessions are scored in one vectorized step
+score_engine = ScoringEngine(capacity=int(os.environ.get('MAX_SESSIONS', 256)))
+score_batcher = ScoreBatcher(
+    lambda items: score_frames([detector for detector, _ in items], [frame for _, frame in items]),
+    max_batch=int(os.environ.get('SCORE_BATCH_MAX', 256)),
+)
+
+# Per-candidate detector state; evicting a session also frees its FaceMesh
+# and its ScoringEngine slot
+sessions = SessionRegistry(
+    lambda: CheatingDetector(engine=score_engine),
+    max_sessions=int(os.environ.get('MAX_SESSIONS', 256)),
+    ttl=float(os.environ.get('SESSION_TTL', 900)),
+    on_evict=release_meshes,
+)
+
+# Production metrics, exposed on /metrics in Prometheus text format
+metrics_registry = MetricsRegistry()
+frames_processed = metrics_registry.counter('proctor_frames_processed_total', 'Frames scored by the detector')
+faces_detected = metrics_registry.counter('proctor_faces_detected_total', 'Faces found by FaceMesh across all frames')
+face_absences = metrics_registry.counter('proctor_face_absences_total', 'Frames rejected because the face was absent too long')
+frames_reused = metrics_registry.counter('proctor_frames_reused_total', 'Frames scored with reused metrics because the scene was static')
+roi_frames = metrics_registry.counter('proctor_roi_frames_total', 'Frames whose inference ran on a face crop')
+identity_mismatches = metrics_registry.counter('proctor_identity_mismatches_total', 'Re-verification checks that did not match the registered reference')
+frame_errors = metrics_registry.counter('proctor_errors_total', 'Frames that failed to decode or analyze')
+metrics_registry.gauge('proctor_active_sessions', 'Sessions held in the registry', lambda: len(sessions))
+metrics_registry.gauge('proctor_face_mesh_instances', 'Live pooled FaceMesh graphs', lambda: len(mesh_pool) + len(roi_mesh_pool))
+metrics_registry.gauge('proctor_score_batch_mean_size', 'Mean number of sessions scored per ScoringEngine step',
+                       lambda: score_batcher.items / max(1, score_batcher.batches))
+
+def stage_histogram(stage):
+    return metrics_registry.histogram('proctor_stage_duration_seconds',
+                                      'Time spent in each frame processing stage',
+                                      labels={'stage': stage})
+
+decode_time = stage_histogram('decode')
+inference_time = stage_histogram('face_mesh')
+head_pose_time = stage_histogram('head_pose')
+mouth_time = stage_histogram('mouth')
+gaze_time = stage_histogram('eye_gaze')
+scoring_time = stage_histogram('scoring')
+serialize_time = stage_histogram('serialize')
+reverify_time = stage_histogram('reverify')
+
+def get_session_id(data=None):
+    """Resolve the session ID from the X-Session-ID header, query string or JSON body"""
+    session_id = request.headers.get('X-Session-ID') or request.args.get('session_id')
+    if not session_id and isinstance(data, dict):
+        session_id = data.get('session_id')
+    return str(session_id) if session_id else 'default'
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "ok"})
+    return jsonify({"status": "ok", "active_sessions": len(sessions)})
 
-@app.route('/process-frame', methods=['POST'])
-def process_frame():
-    """Process a single frame from the frontend"""
-    global detector
-    
-    try:
-        # Get frame data from request
-        data = request.json
-        if not data or 'frame' not in data:
-            return jsonify({"error": "No frame data provided"}), 400
-            
-        # Decode base64 image
-        frame_data = data['frame'].split(',')[1]  # Remove data URL prefix
-        frame_bytes = base64.b64decode(frame_data)
-        nparr = np.frombuffer(frame_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
-            return jsonify({"error": "Failed to decode frame"}), 400
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Motion gating: static frames reuse the previous metrics (MOTION_GATE_MAX_SKIP=0 disables)
+MOTION_GATE_THRESHOLD = float(os.environ.get('MOTION_GATE_THRESHOLD', 3.0))
+MOTION_GATE_MAX_SKIP = int(os.environ.get('MOTION_GATE_MAX_SKIP', 4))
+
+# Face-ROI cropping: after a face is found, infer on a crop of this size (0 disables)
+ROI_CROP_SIZE = int(os.environ.get('ROI_CROP_SIZE', 256))
+# Seconds between forced full-frame passes, so a second face is never missed for long
+ROI_FULL_FRAME_INTERVAL = float(os.environ.get('ROI_FULL_FRAME_INTERVAL', 2.0))
+
+# Identity re-verification cadence (seconds) for sessions with a registered reference
+REVERIFY_INTERVAL = float(os.environ.get('REVERIFY_INTERVAL', 30.0))
+
+# Registered candidates' encodings, shared by all workers through this file
+IDENTITY_GALLERY_PATH = os.environ.get('IDENTITY_GALLERY_PATH', 'identity_gallery.npz')
+
+# Per-frame metrics logs: set to a directory to keep one .frames file per
+# session lifetime (off by default)
+FRAME_STORE_DIR = os.environ.get('FRAME_STORE_DIR') or None
+
+# Upper bound on frames accepted by one /process-frames request
+MAX_BATCH_FRAMES = int(os.environ.get('MAX_BATCH_FRAMES', 64))
+
+# Content types whose request body is the encoded image itself
+RAW_FRAME_MIMETYPES = ('image/jpeg', 'image/png', 'image/webp', 'application/octet-stream')
+
+class FrameDecodeError(ValueError):
+    """Raised when a request does not carry a decodable frame"""
+
+def decode_image(buffer):
+    """Decode an encoded image held in any bytes-like buffer without copying it"""
+    frame = cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise FrameDecodeError("Failed to decode frame")
+    return frame
+
+def decode_data_url(data_url):
+    """Decode a base64 data URL (or bare base64 string) into a BGR frame"""
+    if not isinstance(data_url, str):
+        raise FrameDecodeError("Frame must be a base64 string")
+    frame_data = data_url.split(',', 1)[-1]  # Remove data URL prefix
+    return decode_image(base64.b64decode(frame_data))
+
+def decode_request_frame():
+    """
+    Decode the frame carried by the current request
+
+    Accepts a raw image body (image/jpeg, application/octet-stream, ...),
+    a multipart upload with a 'frame' file part, or the original JSON body
+    with a base64 data URL in 'frame'.
+
+    Returns:
+        (frame, data) where data holds any accompanying fields
+    """
+    mimetype = request.mimetype
+    if mimetype in RAW_FRAME_MIMETYPES:
+        # Hand the request buffer straight to the decoder
+        body = request.get_data(cache=False)
+        if not body:
+            raise FrameDecodeError("No frame data provided")
+        return decode_image(body), None
+        
+    if mimetype == 'multipart/form-data':
+        upload = request.files.get('frame')
+        if upload is None:
+            raise FrameDecodeError("No frame data provided")
+        return decode_image(upload.read()), request.form
+        
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'frame' not in data:
+        raise FrameDecodeError("No frame data provided")
+    return decode_data_url(data['frame']), data
+
+def decode_request_batch():
+    """
+    Decode the ordered frames carried by a /process-frames request
+
+    Accepts JSON ({"frames": [{"frame": <data URL>, "timestamp": <s>}, ...]})
+    or multipart with repeated 'frames' file parts and matching repeated
+    'timestamp' fields.
+
+    Returns:
+        ([(timestamp or None, frame), ...], data)
+    """
+    if request.mimetype == 'multipart/form-data':
+        uploads = request.files.getlist('frames')
+        timestamps = request.form.getlist('timestamp')
+        if timestamps and len(timestamps) != len(uploads):
+            raise FrameDecodeError("Expected one timestamp per frame")
+        if len(uploads) > MAX_BATCH_FRAMES:
+            raise FrameDecodeError(f"At most {MAX_BATCH_FRAMES} frames per batch")
+        frames = []
+        for i, upload in enumerate(uploads):
+            timestamp = float(timestamps[i]) if timestamps else None
+            frames.append((timestamp, decode_image(upload.read())))
+        data = request.form
+    else:
+        data = request.get_json(silent=True)
+        items = data.get('frames') if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            raise FrameDecodeError("No frame data provided")
+        if len(items) > MAX_BATCH_FRAMES:
+            raise FrameDecodeError(f"At most {MAX_BATCH_FRAMES} frames per batch")
+        frames = []
+        for item in items:
+            if not isinstance(item, dict) or 'frame' not in item:
+                raise FrameDecodeError("Each batch item must be an object with a 'frame'")
+            timestamp = item.get('timestamp')
+            timestamp = float(timestamp) if timestamp is not None else None
+            frames.append((timestamp, decode_data_url(item['frame'])))
             
-        # Initialize detector if not already done
-        if detector is None:
-            detector = CheatingDetector()
+    if not frames:
+        raise FrameDecodeError("No frame data provided")
+    return frames, data
+
+def to_server_clock(frames):
+    """
+    Shift client capture timestamps onto the server clock
+
+    The newest frame is pinned to the current time and the others keep
+    their relative spacing, so face-absence timing reflects when the frames
+    were captured rather than when the burst arrived.
+    """
+    stamps = [t for t, _ in frames if t is not None]
+    if not stamps:
+        return frames
+    offset = time.time() - max(stamps)
+    return [(t + offset if t is not None else None, frame) for t, frame in frames]
+
+def analyze_frame(session_id, frame, timestamp=None):
+    """
+    Run one decoded frame through the session's FaceMesh and detector
+
+    Returns:
+        JSON-serializable result dict
+    """
+    session = sessions.get_or_create(session_id)
+    
+    # Frames of one session are analyzed strictly one at a time
+    with session.lock:
+        return analyze_session_frame(session, frame, timestamp)
+
+def analyze_session_frame(session, frame, timestamp=None):
+    """
+    Analyze a frame for a session whose lock is already held
+
+    Args:
+        timestamp: Capture time in server-clock seconds; defaults to now
+    """
+    if MOTION_GATE_MAX_SKIP > 0:
+        if session.motion_gate is None:
+            session.motion_gate = MotionGate(MOTION_GATE_THRESHOLD, MOTION_GATE_MAX_SKIP)
+        if session.last_metrics is None:
+            session.motion_gate.reset()
+        if session.motion_gate.should_skip(frame):
+            # Scene unchanged since the last analyzed frame: skip inference
+            # and feed the previous metrics through the detector again
+            frames_reused.inc()
+            num_faces, head_tilt_pose, mouth_state, gaze_info = session.last_metrics
+            result = score_session_frame(session.detector, num_faces, timestamp, head_tilt_pose, mouth_state, gaze_info)
+            result["reused"] = True
+            record_frame(session, timestamp, num_faces, result, gaze_info, *session.last_pose)
+            return result
+        session.last_metrics = None  # stays unset if this analysis fails
             
-        # Mirror frame
-        frame = mirrorImage(frame)
-        
-        # Process frame with MediaPipe
-        with mp_face_mesh.FaceMesh(
-            max_num_faces=2,
-            refine_landmarks=True,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        ) as face_mesh:
+    frame, results = infer_landmarks(session, frame)
+    return score_landmarks(session, frame, results, timestamp)
+
+def infer_landmarks(session, frame):
+    """
+    Mirror a frame and run it through the session's FaceMesh
+
+    Once a face has been found, inference runs on a crop around it; the
+    returned landmarks are always in full-frame coordinates.
+    """
+    # Mirror frame
+    frame = mirrorImage(frame)
+    
+    tracker = session.roi_tracker
+    if tracker is None and ROI_CROP_SIZE > 0:
+        tracker = session.roi_tracker = FaceRoiTracker(ROI_CROP_SIZE, full_frame_interval=ROI_FULL_FRAME_INTERVAL)
+    
+    # Process frame with the session's pooled MediaPipe instances
+    started = time.perf_counter()
+    crop, box = tracker.crop(frame) if tracker is not None else (None, None)
+    if crop is not None:
+        with roi_mesh_pool.acquire(session.session_id) as face_mesh:
+            results = face_mesh.process(bgr2rgb(crop))
+        if results.multi_face_landmarks:
+            roi_frames.inc()
+        else:
+            # Face left the crop: fall back to the full frame
+            crop = box = None
+    if crop is None:
+        with mesh_pool.acquire(session.session_id) as face_mesh:
             # Convert to RGB for MediaPipe
             rgb_frame = bgr2rgb(frame)
             results = face_mesh.process(rgb_frame)
+    if tracker is not None:
+        tracker.update(results, frame.shape, box)
+    inference_time.observe(time.perf_counter() - started)
+    return frame, results
+
+def face_context(session, frame, results):
+    """
+    FrameContext of the first face of the latest inference, reusing the
+    landmark array the ROI tracker already read; None without a face
+    """
+    if not results.multi_face_landmarks:
+        return None
+    face_landmarks = results.multi_face_landmarks[0]
+    tracker = session.roi_tracker
+    points = tracker.points_for(face_landmarks) if tracker is not None else None
+    return FrameContext(face_landmarks, frame.shape, normalized=points)
+
+def score_landmarks(session, frame, results, timestamp=None, ctx=None, gaze_info=None):
+    """
+    Update the session detector from FaceMesh results and build the response
+
+    Args:
+        ctx: Precomputed FrameContext for the first face, if any
+        gaze_info: Precomputed gaze for that face (e.g. from batchEyeGaze)
+    """
+    num_faces = len(results.multi_face_landmarks) if results.multi_face_landmarks else 0
+    faces_detected.inc(num_faces)  # only frames that went through inference
+    head_tilt_pose = mouth_state = None
+    
+    # Process face landmarks
+    if num_faces:
+        # Landmarks converted once and shared by the analyzers
+        if ctx is None:
+            ctx = face_context(session, frame, results)
+        
+        # Get various metrics (headless: the annotated frame is never returned)
+        started = time.perf_counter()
+        head_tilt_pose = pipelineHeadTiltPose(frame, ctx, draw=False)
+        finished = time.perf_counter()
+        head_pose_time.observe(finished - started)
+        mouth_state = pipelineMouthState(frame, ctx, draw=False)
+        started = time.perf_counter()
+        mouth_time.observe(started - finished)
+        if gaze_info is None:
+            gaze_info = pipelineEyeGaze(frame, ctx, draw=False)
+            gaze_time.observe(time.perf_counter() - started)
+        else:
+            ctx.gaze_info = gaze_info
             
-            # Update face presence
-            num_faces = len(results.multi_face_landmarks) if results.multi_face_landmarks else 0
-            face_absent = not detector.update_face_presence(num_faces)
+    identity = None
+    if session.reverifier is not None:
+        started = time.perf_counter()
+        box = ctx.bounding_box() if num_faces else None
+        identity = session.reverifier.update(frame, box, num_faces, now=timestamp)
+        if identity is not None:
+            reverify_time.observe(time.perf_counter() - started)
+            if not identity["verified"]:
+                identity_mismatches.inc()
             
-            if face_absent:
-                return jsonify({
-                    "status": "error",
-                    "message": "Face absent for too long",
-                    "score": 1.0,
-                    "risk_level": "HIGH RISK"
-                })
-                
-            # Process face landmarks
-            if results.multi_face_landmarks:
-                for face_landmarks in results.multi_face_landmarks:
-                    # Get various metrics
-                    head_tilt_pose = pipelineHeadTiltPose(frame, face_landmarks)
-                    mouth_state = pipelineMouthState(frame, face_landmarks)
-                    gaze_info = pipelineEyeGaze(frame, face_landmarks)
-                    
-                    # Calculate cheating score
-                    score = detector.calculate_cheating_score(gaze_info, head_tilt_pose, mouth_state)
-                    status, _ = detector.get_cheating_status(score)
-                    
-                    # Update session statistics
-                    detector.update_session_stats(score, status, 
-                                                multiple_faces=detector.multiple_faces_detected)
-                    
-                    return jsonify({
-                        "status": "success",
-                        "score": float(score),
-                        "risk_level": status,
-                        "metrics": {
-                            "head_tilt": head_tilt_pose,
-                            "mouth_state": mouth_state,
-                            "gaze_direction": gaze_info['direction'],
-                            "multiple_faces": detector.multiple_faces_detected
-                        }
-                    })
-                    
-            # No face detected
-            return jsonify({
-                "status": "error",
-                "message": "No face detected",
-                "score": 1.0,
-                "risk_level": "HIGH RISK"
-            })
+    head_angles, lip_distance = (ctx.head_angles, ctx.lip_distance) if num_faces else (None, None)
+    session.last_metrics = (num_faces, head_tilt_pose, mouth_state, gaze_info)
+    session.last_pose = (head_angles, lip_distance)
+    result = score_session_frame(session.detector, num_faces, timestamp, head_tilt_pose, mouth_state, gaze_info)
+    record_frame(session, timestamp, num_faces, result, gaze_info, head_angles, lip_distance)
+    if identity is not None:
+        result["identity"] = identity
+    return result
+
+def record_frame(session, timestamp, num_faces, result, gaze_info, head_angles, lip_distance):
+    """Append a scored frame to the session's metrics log, if enabled"""
+    if not FRAME_STORE_DIR:
+        return
+    if session.frame_store is None:
+        session.frame_store = FrameStoreWriter(frame_store_path(session.session_id))
+    session.frame_store.append(frame_record(
+        timestamp if timestamp is not None else time.time(), num_faces, result,
+        gaze_info, head_angles, lip_distance, session.detector.last_components))
+
+def frame_store_path(session_id):
+    """
+    Log file for a new session lifetime:
+    <FRAME_STORE_DIR>/<readable id>-<id hash>-<start ms>.frames
+
+    The hash keeps IDs that sanitize to the same name (a/b, a_b) apart,
+    and the start time gives a reset or re-created session a fresh file.
+    """
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', session_id)[:64]
+    digest = hashlib.sha1(session_id.encode('utf-8')).hexdigest()[:10]
+    return os.path.join(FRAME_STORE_DIR, f"{name}-{digest}-{int(time.time() * 1000)}.frames")
+
+def score_session_frame(detector, num_faces, timestamp=None, head_tilt_pose=None, mouth_state=None, gaze_info=None):
+    """
+    score_frame for a live session: frames of other sessions being scored
+    at the same moment are combined into one ScoringEngine step
+
+    The caller holds the session lock, so a batch never holds two frames
+    of one session.
+    """
+    if detector.engine is None:  # session closed while this frame waited
+        return score_frame(detector, num_faces, timestamp, head_tilt_pose, mouth_state, gaze_info)
+    return score_batcher.submit((detector, (num_faces, timestamp, head_tilt_pose, mouth_state, gaze_info)))
+
+def score_frame(detector, num_faces, timestamp=None, head_tilt_pose=None, mouth_state=None, gaze_info=None):
+    """
+    Advance a detector by one frame's analyzer outputs
+
+    Shared by the live endpoints and the offline video analyzer so both
+    score frames identically.
+
+    Returns:
+        JSON-serializable result dict
+    """
+    result = begin_frame(detector, num_faces, timestamp, gaze_info)
+    if result is not None:
+        return result
+        
+    started = time.perf_counter()
+    # Calculate cheating score
+    score = detector.calculate_cheating_score(gaze_info, head_tilt_pose, mouth_state)
+    status, _ = detector.get_cheating_status(score)
+    result = finish_frame(detector, score, status, head_tilt_pose, mouth_state, gaze_info)
+    scoring_time.observe(time.perf_counter() - started)
+    return result
+
+def score_frames(detectors, frames):
+    """
+    Advance several sessions' detectors by one frame each
+
+    The detectors must share one ScoringEngine; every frame that gets a
+    score is scored in a single vectorized step. Results are identical to
+    calling score_frame per detector.
+
+    Args:
+        detectors: Distinct detectors, one per session
+        frames: Matching (num_faces, timestamp, head_tilt_pose, mouth_state, gaze_info) tuples
+
+    Returns:
+        List of result dicts, in order
+    """
+    results = [None] * len(detectors)
+    pending = []
+    for i, (detector, (num_faces, timestamp, _, _, gaze_info)) in enumerate(zip(detectors, frames)):
+        results[i] = begin_frame(detector, num_faces, timestamp, gaze_info)
+        if results[i] is None:
+            pending.append(i)
+    if not pending:
+        return results
+        
+    started = time.perf_counter()
+    scores = calculate_cheating_scores([detectors[i] for i in pending],
+                                       [frames[i][4] for i in pending],
+                                       [frames[i][2] for i in pending],
+                                       [frames[i][3] for i in pending])
+    statuses = ScoringEngine.statuses(scores)
+    for i, score, status in zip(pending, scores, statuses):
+        _, _, head_tilt_pose, mouth_state, gaze_info = frames[i]
+        results[i] = finish_frame(detectors[i], score, status, head_tilt_pose, mouth_state, gaze_info)
+    elapsed = time.perf_counter() - started
+    for _ in pending:
+        scoring_time.observe(elapsed / len(pending))
+    return results
+
+def begin_frame(detector, num_faces, timestamp, gaze_info):
+    """
+    Count the frame and update face presence
+
+    Returns:
+        The error result if the frame cannot be scored, else None
+    """
+    frames_processed.inc()
+    
+    # Update face presence
+    face_absent = not detector.update_face_presence(num_faces, now=timestamp)
+    
+    if face_absent:
+        face_absences.inc()
+        return {
+            "status": "error",
+            "message": "Face absent for too long",
+            "score": 1.0,
+            "risk_level": "HIGH RISK"
+        }
+        
+    if not num_faces or gaze_info is None:
+        # No face detected
+        return {
+            "status": "error",
+            "message": "No face detected",
+            "score": 1.0,
+            "risk_level": "HIGH RISK"
+        }
+    return None
+
+def finish_frame(detector, score, status, head_tilt_pose, mouth_state, gaze_info):
+    """Record a scored frame in the session statistics and build its result"""
+    # Update session statistics
+    detector.update_session_stats(score, status, 
+                                multiple_faces=detector.multiple_faces_detected)
+    
+    return {
+        "status": "success",
+        "score": float(score),
+        "risk_level": status,
+        "metrics": {
+            "head_tilt": head_tilt_pose,
+            "mouth_state": mouth_state,
+            "gaze_direction": gaze_info['direction'],
+            "multiple_faces": detector.multiple_faces_detected
+        }
+    }
+
+@app.route('/process-frame', methods=['POST'])
+def process_frame():
+    """Process a single frame sent as JSON, a raw image body or multipart"""
+    started = time.perf_counter()
+    try:
+        frame, data = decode_request_frame()
+    except ValueError as e:  # FrameDecodeError or malformed base64
+        frame_errors.inc()
+        return jsonify({"error": str(e)}), 400
+    decode_time.observe(time.perf_counter() - started)
+        
+    try:
+        result = analyze_frame(get_session_id(data), frame)
+        started = time.perf_counter()
+        response = jsonify(result)
+        serialize_time.observe(time.perf_counter() - started)
+        return response
+    except MeshPoolExhausted as e:
+        frame_errors.inc()
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 503
+    except Exception as e:
+        frame_errors.inc()
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
+
+@app.route('/process-frames', methods=['POST'])
+def process_frames():
+    """Process an ordered batch of timestamped frames for one session"""
+    started = time.perf_counter()
+    try:
+        frames, data = decode_request_batch()
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        frame_errors.inc()
+        return jsonify({"error": f"Invalid batch: {e}"}), 400
+    decode_time.observe(time.perf_counter() - started)
+        
+    try:
+        session = sessions.get_or_create(get_session_id(data))
+        results = []
+        # Hold the session lock for the whole burst so no other request interleaves
+        with session.lock:
+            # FaceMesh tracking is sequential, so inference runs frame by frame
+            inferred, contexts = [], []
+            for _, frame in frames:
+                frame, mesh = infer_landmarks(session, frame)
+                inferred.append((frame, mesh))
+                contexts.append(face_context(session, frame, mesh))
+            
+            # Gaze for every frame with a face in one vectorized pass
+            with_face = [ctx for ctx in contexts if ctx is not None]
+            gaze_infos = iter(gazeInfoList(batchEyeGaze(stackContexts(with_face))) if with_face else [])
+            
+            timestamps = [t for t, _ in to_server_clock(frames)]
+            for (client_time, _), timestamp, (frame, mesh), ctx in zip(frames, timestamps, inferred, contexts):
+                gaze_info = next(gaze_infos) if ctx is not None else None
+                result = score_landmarks(session, frame, mesh, timestamp, ctx=ctx, gaze_info=gaze_info)
+                result["timestamp"] = client_time
+                results.append(result)
             
+            # The gate's reference frame predates this burst; the next
+            # single frame must be analyzed, not matched against it
+            if session.motion_gate is not None:
+                session.motion_gate.reset()
+                
+        scores = [r["score"] for r in results]
+        return jsonify({
+            "status": "success",
+            "results": results,
+            "aggregate": {
+                "frames": len(results),
+                "faces_analyzed": sum(1 for r in results if r["status"] == "success"),
+                "average_score": sum(scores) / len(scores),
+                "max_score": max(scores),
+                "score": results[-1]["score"],
+                "risk_level": results[-1]["risk_level"]
+            }
+        })
+    except MeshPoolExhausted as e:
+        frame_errors.inc()
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 503
     except Exception as e:
+        frame_errors.inc()
         return jsonify({
             "status": "error",
             "message": str(e)
         }), 500
 
+def decode_stream_message(message):
+    """Decode a WebSocket message: binary image bytes, a data URL or {"frame": ...} JSON"""
+    if isinstance(message, (bytes, bytearray)):
+        return decode_image(message)
+    if message.lstrip().startswith('{'):
+        return decode_data_url(json.loads(message)['frame'])
+    return decode_data_url(message)
+
+if Sock is not None:
+    sock = Sock(app)
+    
+    @sock.route('/stream')
+    def stream_frames(ws):
+        """
+        Stream frames for one session over a WebSocket
+        
+        A reader thread parks incoming messages in a LatestFrameSlot while
+        this handler analyzes them, so when analysis falls behind stale
+        frames are dropped (never decoded) rather than queued. Each result
+        is sent back with its sequence number and the running drop count.
+        """
+        session_id = get_session_id()
+        slot = LatestFrameSlot()
+        
+        def receive_frames():
+            try:
+                while True:
+                    message = ws.receive()
+                    if message is None:
+                        break
+                    slot.put(message)
+            except ConnectionClosed:
+                pass
+            finally:
+                slot.close()
+                
+        threading.Thread(target=receive_frames, daemon=True).start()
+        
+        try:
+            while True:
+                item = slot.get()
+                if item is None:
+                    break
+                seq, message = item
+                try:
+                    started = time.perf_counter()
+                    frame = decode_stream_message(message)
+                    decode_time.observe(time.perf_counter() - started)
+                    result = analyze_frame(session_id, frame)
+                except (ValueError, KeyError) as e:
+                    frame_errors.inc()
+                    result = {"status": "error", "message": f"Invalid frame: {e}"}
+                except Exception as e:
+                    frame_errors.inc()
+                    result = {"status": "error", "message": str(e)}
+                result["seq"] = seq
+                result["dropped"] = slot.dropped
+                ws.send(json.dumps(result))
+        except ConnectionClosed:
+            pass
+        finally:
+            slot.close()
+
 @app.route('/get-session-summary', methods=['GET'])
 def get_session_summary():
-    """Get the current session summary"""
-    global detector
-    if detector is None:
+    """Get the summary of one session"""
+    session = sessions.get(get_session_id())
+    if session is None:
         return jsonify({"error": "No active session"}), 400
         
-    summary = detector.get_session_summary()
+    with session.lock:
+        summary = session.detector.get_session_summary()
+        if session.frame_store is not None:
+            session.frame_store.flush()  # the log is complete up to this summary
     return jsonify({"summary": summary})
 
+@app.route('/register-reference', methods=['POST'])
+def register_reference():
+    """
+    Register a session's reference photo and enable periodic re-verification
+    
+    Accepts the image as a raw body (image/jpeg, ...) or as JSON with a
+    base64 data URL in 'image'. Encodings are cached by image hash. With
+    a candidate_id (JSON field or query argument) the encoding is also
+    added to the identity gallery used by /impersonation-check.
+    """
+    data = None
+    if request.mimetype in RAW_FRAME_MIMETYPES:
+        image_bytes = request.get_data()
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or 'image' not in data:
+            return jsonify({"error": "No reference image provided"}), 400
+        try:
+            image_bytes = base64.b64decode(data['image'].split(',', 1)[-1])
+        except (ValueError, AttributeError) as e:
+            return jsonify({"error": f"Invalid reference image: {e}"}), 400
+    if not image_bytes:
+        return jsonify({"error": "No reference image provided"}), 400
+        
+    try:
+        encoding = default_cache().encoding_for_bytes(image_bytes)
+    except ValueError as e:  # no face in the photo
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:  # undecodable image
+        return jsonify({"error": f"Invalid reference image: {e}"}), 400
+        
+    candidate_id = request.args.get('candidate_id')
+    if not candidate_id and isinstance(data, dict):
+        candidate_id = data.get('candidate_id')
+    if candidate_id:
+        candidate_id = str(candidate_id)
+        update_gallery(lambda updated: updated.add(candidate_id, encoding))
+        
+    session = sessions.get_or_create(get_session_id(data))
+    with session.lock:
+        session.reverifier = ReVerifier(encoding, interval=REVERIFY_INTERVAL)
+        session.candidate_id = candidate_id or None
+    return jsonify({"status": "success", "message": "Reference registered"})
+
+gallery = IdentityGallery()
+gallery_mtime = None
+gallery_lock = threading.Lock()
+
+def current_gallery():
+    """The identity gallery, reloaded if another process saved a newer copy"""
+    global gallery, gallery_mtime
+    with gallery_lock:
+        try:
+            mtime = os.stat(IDENTITY_GALLERY_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return gallery
+        if mtime != gallery_mtime:
+            gallery = IdentityGallery.load(IDENTITY_GALLERY_PATH)
+            gallery_mtime = mtime
+        return gallery
+
+def update_gallery(change):
+    """
+    Apply change(gallery) to the gallery file and publish the result
+
+    The file is reloaded, changed and rewritten under a cross-process lock,
+    so concurrent updates from several workers are not lost. The change is
+    made on a fresh copy; queries keep using the previous gallery until the
+    new one is saved.
+
+    Returns:
+        Whatever change() returns
+    """
+    global gallery, gallery_mtime
+    with file_lock(IDENTITY_GALLERY_PATH):
+        if os.path.exists(IDENTITY_GALLERY_PATH):
+            updated = IdentityGallery.load(IDENTITY_GALLERY_PATH)
+        else:
+            updated = IdentityGallery()
+        result = change(updated)
+        updated.save(IDENTITY_GALLERY_PATH)
+        with gallery_lock:
+            gallery = updated
+            gallery_mtime = os.stat(IDENTITY_GALLERY_PATH).st_mtime_ns
+    return result
+
+@app.route('/impersonation-check', methods=['POST'])
+def impersonation_check():
+    """
+    Match the latest re-verification encodings of live sessions against
+    every registered candidate in one batched gallery query
+    
+    A session is flagged when its face is within tolerance of a candidate
+    other than the one registered for it.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid parameters: expected a JSON object"}), 400
+    try:
+        k = int(data.get('k', 3))
+        tolerance = float(data.get('tolerance', 0.6))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameters: {e}"}), 400
+    if k < 1:
+        return jsonify({"error": "Invalid parameters: k must be at least 1"}), 400
+    wanted = data.get('session_ids')
+    if wanted is not None:
+        if not isinstance(wanted, list):
+            return jsonify({"error": "Invalid parameters: session_ids must be a list"}), 400
+        wanted = set(map(str, wanted))
+    
+    live = [state for state in sessions.states()
+            if state.reverifier is not None and state.reverifier.last_encoding is not None
+            and (wanted is None or state.session_id in wanted)]
+    if not live:
+        return jsonify({"status": "success", "sessions": []})
+        
+    ids, distances = current_gallery().query(np.stack([s.reverifier.last_encoding for s in live]), k=k)
+    report = []
+    for state, row_ids, row_distances in zip(live, ids, distances):
+        matches = [{"candidate_id": candidate_id, "distance": float(distance)}
+                   for candidate_id, distance in zip(row_ids, row_distances)]
+        report.append({
+            "session_id": state.session_id,
+            "candidate_id": state.candidate_id,
+            "matches": matches,
+            "suspected": any(m["distance"] <= tolerance and m["candidate_id"] != state.candidate_id
+                             for m in matches)
+        })
+    return jsonify({"status": "success", "sessions": report})
+
+@app.route('/remove-candidate', methods=['POST'])
+def remove_candidate():
+    """Remove a registered candidate from the identity gallery"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    candidate_id = data.get('candidate_id')
+    if not candidate_id:
+        return jsonify({"error": "No candidate_id provided"}), 400
+    if not update_gallery(lambda updated: updated.remove(str(candidate_id))):
+        return jsonify({"error": "Unknown candidate"}), 404
+    return jsonify({"status": "success", "message": "Candidate removed"})
+
 @app.route('/reset-session', methods=['POST'])
 def reset_session():
-    """Reset the current session"""
-    global detector
-    detector = CheatingDetector()
+    """Reset one session's detector and tracking state"""
+    session_id = get_session_id(request.get_json(silent=True))
+    previous = sessions.get(session_id)
+    session = sessions.reset(session_id)
+    if previous is not None and previous.reverifier is not None:
+        # The registered reference outlives a reset; its check schedule does not
+        reference = previous.reverifier
+        session.reverifier = ReVerifier(reference.reference_encoding, reference.interval, reference.tolerance)
+        session.candidate_id = previous.candidate_id
     return jsonify({"status": "success", "message": "Session reset"})
 
 if __name__ == "__main__":
-    # Initialize detector
-    detector = CheatingDetector()
-    
     # Run Flask app
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True)
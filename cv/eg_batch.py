@@ -0,0 +1,93 @@
+import numpy as np
+
+from eg_helper import (LEFT_EYE_METRIC_INDICES, RIGHT_EYE_METRIC_INDICES,
+                       GAZE_LEFT_THRESHOLD, GAZE_RIGHT_THRESHOLD,
+                       GAZE_UP_THRESHOLD, GAZE_DOWN_THRESHOLD,
+                       GAZE_EXTREME_THRESHOLD, segmentLengths)
+
+HORIZONTAL_LABELS = ("Left", "Center", "Right")
+VERTICAL_LABELS = ("Up", "Center", "Down")
+
+# Direction code = vertical * 3 + horizontal; labels match determineEyeGaze
+GAZE_DIRECTIONS = tuple(
+    "Center" if (v == "Center" and h == "Center") else f"{v}-{h}"
+    for v in VERTICAL_LABELS for h in HORIZONTAL_LABELS
+)
+GAZE_CENTER = GAZE_DIRECTIONS.index("Center")
+
+def stackContexts(contexts):
+    """Stack the pixel landmarks of several FrameContexts into an (N, 478, 2) array"""
+    return np.stack([ctx.pixels for ctx in contexts])
+
+def batchEyeGaze(landmarks):
+    """
+    Vectorized determineEyeGaze over many faces at once
+
+    Args:
+        landmarks: (N, 478, 2+) landmark positions in pixels. Float input is
+            truncated to integer pixels exactly like EyeRegion does.
+
+    Returns:
+        dict of (N,) arrays: l_x_ratio, l_y_ratio, r_x_ratio, r_y_ratio,
+        avg_x_ratio, avg_y_ratio, horizontal and vertical codes (0..2),
+        direction codes (index into GAZE_DIRECTIONS) and out_of_screen flags
+    """
+    landmarks = np.asarray(landmarks)
+    pixels = landmarks[..., :2]
+    if not np.issubdtype(pixels.dtype, np.integer):
+        pixels = pixels.astype(np.int64)
+
+    # Columns: eye width, eye height, iris-inner, iris-top
+    left = segmentLengths(pixels[:, LEFT_EYE_METRIC_INDICES])
+    right = segmentLengths(pixels[:, RIGHT_EYE_METRIC_INDICES])
+
+    # The inner corner of the left eye is on the right, so its ratio is inverted
+    l_x_ratio = 1.0 - left[:, 2] / (left[:, 0] + 1e-6)
+    l_y_ratio = left[:, 3] / (left[:, 1] + 1e-6)
+    r_x_ratio = right[:, 2] / (right[:, 0] + 1e-6)
+    r_y_ratio = right[:, 3] / (right[:, 1] + 1e-6)
+
+    avg_x_ratio = (l_x_ratio + r_x_ratio) / 2
+    avg_y_ratio = (l_y_ratio + r_y_ratio) / 2
+
+    horizontal = np.ones(len(pixels), dtype=np.int8)
+    horizontal[avg_x_ratio < GAZE_LEFT_THRESHOLD] = 0
+    horizontal[avg_x_ratio > GAZE_RIGHT_THRESHOLD] = 2
+    vertical = np.ones(len(pixels), dtype=np.int8)
+    vertical[avg_y_ratio < GAZE_UP_THRESHOLD] = 0
+    vertical[avg_y_ratio > GAZE_DOWN_THRESHOLD] = 2
+
+    out_of_screen = ((avg_x_ratio < GAZE_EXTREME_THRESHOLD) | (avg_x_ratio > (1 - GAZE_EXTREME_THRESHOLD)) |
+                     (avg_y_ratio < GAZE_EXTREME_THRESHOLD) | (avg_y_ratio > (1 - GAZE_EXTREME_THRESHOLD)))
+
+    return {
+        'l_x_ratio': l_x_ratio,
+        'l_y_ratio': l_y_ratio,
+        'r_x_ratio': r_x_ratio,
+        'r_y_ratio': r_y_ratio,
+        'avg_x_ratio': avg_x_ratio,
+        'avg_y_ratio': avg_y_ratio,
+        'horizontal': horizontal,
+        'vertical': vertical,
+        'direction': vertical * 3 + horizontal,
+        'out_of_screen': out_of_screen,
+    }
+
+def gazeInfoList(batch):
+    """Expand a batchEyeGaze result into determineEyeGaze-style dicts"""
+    columns = {key: value.tolist() for key, value in batch.items()}
+    gaze_infos = []
+    for i in range(len(columns['direction'])):
+        gaze_infos.append({
+            'direction': GAZE_DIRECTIONS[columns['direction'][i]],
+            'horizontal': HORIZONTAL_LABELS[columns['horizontal'][i]],
+            'vertical': VERTICAL_LABELS[columns['vertical'][i]],
+            'out_of_screen': columns['out_of_screen'][i],
+            'l_x_ratio': columns['l_x_ratio'][i],
+            'l_y_ratio': columns['l_y_ratio'][i],
+            'r_x_ratio': columns['r_x_ratio'][i],
+            'r_y_ratio': columns['r_y_ratio'][i],
+            'avg_x_ratio': columns['avg_x_ratio'][i],
+            'avg_y_ratio': columns['avg_y_ratio'][i],
+        })
+    return gaze_infos
@@ -1,7 +1,8 @@
 import cv2
 import mediapipe as mp
 import numpy as np
-from scipy.spatial import distance as dist
+from g_helper import shouldRender
+from frame_context import FrameContext
 mp_drawing = mp.solutions.drawing_utils
 mp_drawing_styles = mp.solutions.drawing_styles
 mp_face_mesh = mp.solutions.face_mesh
@@ -46,6 +47,31 @@ RIGHT_EYE_CORNERS = {
 LEFT_IRIS_CENTER = 468
 RIGHT_IRIS_CENTER = 473
 
+# Landmarks used for the iris ratios, in the order outer, inner, top, bottom, iris
+LEFT_EYE_METRIC_INDICES = np.array([LEFT_EYE_CORNERS['outer'], LEFT_EYE_CORNERS['inner'],
+                                    LEFT_EYE_CORNERS['top'], LEFT_EYE_CORNERS['bottom'],
+                                    LEFT_IRIS_CENTER])
+RIGHT_EYE_METRIC_INDICES = np.array([RIGHT_EYE_CORNERS['outer'], RIGHT_EYE_CORNERS['inner'],
+                                     RIGHT_EYE_CORNERS['top'], RIGHT_EYE_CORNERS['bottom'],
+                                     RIGHT_IRIS_CENTER])
+
+# Segments measured per eye: outer-inner (width), top-bottom (height),
+# iris-inner (horizontal position) and iris-top (vertical position)
+EYE_SEGMENT_FROM = np.array([0, 2, 4, 4])
+EYE_SEGMENT_TO = np.array([1, 3, 1, 2])
+
+def segmentLengths(points):
+    """Euclidean length of each EYE_SEGMENT along the second-to-last axis of points"""
+    d = points[..., EYE_SEGMENT_FROM, :] - points[..., EYE_SEGMENT_TO, :]
+    return np.sqrt(d[..., 0] * d[..., 0] + d[..., 1] * d[..., 1])
+
+# Gaze thresholds on the averaged iris ratios
+GAZE_LEFT_THRESHOLD = 0.35
+GAZE_RIGHT_THRESHOLD = 0.60
+GAZE_UP_THRESHOLD = 0.35
+GAZE_DOWN_THRESHOLD = 0.65
+GAZE_EXTREME_THRESHOLD = 0.15  # Threshold for extreme gaze (looking off screen)
+
 class EyeRegion:
     """A class to process and analyze an eye region"""
     
@@ -54,11 +80,12 @@ class EyeRegion:
         Initialize an eye region from face landmarks
         
         Args:
-            landmarks: MediaPipe face mesh landmarks
+            landmarks: MediaPipe face mesh landmarks or a FrameContext
             img_shape: Image dimensions (height, width)
             is_left: Whether this is the left eye (True) or right eye (False)
         """
-        self.landmarks = landmarks
+        self.ctx = FrameContext.of(landmarks, img_shape)
+        self.landmarks = self.ctx.face_landmarks
         self.img_h, self.img_w = img_shape[:2]
         self.is_left = is_left
         
@@ -67,90 +94,83 @@ class EyeRegion:
             self.eye_indices = LEFT_EYE_INDICES
             self.iris_center_idx = LEFT_IRIS_CENTER
             self.corner_indices = LEFT_EYE_CORNERS
+            self.metric_indices = LEFT_EYE_METRIC_INDICES
         else:
             self.eye_indices = RIGHT_EYE_INDICES
             self.iris_center_idx = RIGHT_IRIS_CENTER
             self.corner_indices = RIGHT_EYE_CORNERS
+            self.metric_indices = RIGHT_EYE_METRIC_INDICES
             
-        # Extract eye region points
-        self.eye_points = []
-        self.iris_center = None
-        self.corners = {}
-        
-        self._extract_landmarks()
         self._calculate_metrics()
         
-    def _extract_landmarks(self):
-        """Extract landmark points for the eye region"""
-        # Get all eye contour points
-        for idx in self.eye_indices:
-            x = int(self.landmarks.landmark[idx].x * self.img_w)
-            y = int(self.landmarks.landmark[idx].y * self.img_h)
-            self.eye_points.append((x, y))
-            
-        # Get iris center
-        iris = self.landmarks.landmark[self.iris_center_idx]
-        self.iris_center = (int(iris.x * self.img_w), int(iris.y * self.img_h))
+    @property
+    def eye_points(self):
+        """Eye contour points as (x, y) pixel tuples; only needed for drawing"""
+        return [tuple(p) for p in self.ctx.pixels[self.eye_indices].tolist()]
         
-        # Get corner points
-        for name, idx in self.corner_indices.items():
-            point = self.landmarks.landmark[idx]
-            self.corners[name] = (int(point.x * self.img_w), int(point.y * self.img_h))
+    @property
+    def iris_center(self):
+        return tuple(self.ctx.pixels[self.iris_center_idx].tolist())
+        
+    @property
+    def corners(self):
+        return {name: tuple(self.ctx.pixels[idx].tolist())
+                for name, idx in self.corner_indices.items()}
     
     def _calculate_metrics(self):
         """Calculate eye metrics like iris position"""
         # Calculate iris position ratios
         # 0 = far left/top, 1 = far right/bottom
-        eye_width = dist.euclidean(self.corners['outer'], self.corners['inner'])
-        eye_height = dist.euclidean(self.corners['top'], self.corners['bottom'])
+        eye_width, eye_height, iris_to_inner, iris_to_top = \
+            segmentLengths(self.ctx.pixels[self.metric_indices]).tolist()
         
         # If the eye is the left eye, the inner corner is on the right
+        horizontal_position = iris_to_inner / (eye_width + 1e-6)
         if self.is_left:
-            horizontal_position = dist.euclidean(self.iris_center, self.corners['inner']) / (eye_width + 1e-6)
             # Invert the ratio since the inner corner is on the right for left eye
             self.iris_x_ratio = 1.0 - horizontal_position
         else:
-            horizontal_position = dist.euclidean(self.iris_center, self.corners['inner']) / (eye_width + 1e-6)
             self.iris_x_ratio = horizontal_position
             
-        vertical_position = dist.euclidean(self.iris_center, self.corners['top']) / (eye_height + 1e-6)
+        vertical_position = iris_to_top / (eye_height + 1e-6)
         self.iris_y_ratio = vertical_position
     
     def draw(self, image, color=(0, 255, 0)):
         """Draw eye region on the image for visualization"""
+        eye_points = self.ctx.pixels[self.eye_indices]
+        corners = self.corners
+        
         # Draw eye contour
-        pts = np.array(self.eye_points, np.int32)
-        pts = pts.reshape((-1, 1, 2))
+        pts = eye_points.astype(np.int32).reshape((-1, 1, 2))
         cv2.polylines(image, [pts], True, (0, 255, 255), 1)
         
         # Draw iris center
         cv2.circle(image, self.iris_center, 3, color, -1)
         
         # Draw corner points
-        for name, point in self.corners.items():
+        for name, point in corners.items():
             cv2.circle(image, point, 2, (0, 0, 255), -1)
             
         # Draw bounding box around the eye
-        x_min = min(p[0] for p in self.eye_points)
-        y_min = min(p[1] for p in self.eye_points)
-        x_max = max(p[0] for p in self.eye_points)
-        y_max = max(p[1] for p in self.eye_points)
+        x_min, y_min = eye_points.min(axis=0).tolist()
+        x_max, y_max = eye_points.max(axis=0).tolist()
         cv2.rectangle(image, (x_min, y_min), (x_max, y_max), (255, 0, 0), 1)
         
         # Display metrics
         if self.is_left:
             pos_text = f"L-Eye: x={self.iris_x_ratio:.2f}, y={self.iris_y_ratio:.2f}"
-            cv2.putText(image, pos_text, (10, self.corners['bottom'][1] + 20), 
+            cv2.putText(image, pos_text, (10, corners['bottom'][1] + 20), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
         else:
             pos_text = f"R-Eye: x={self.iris_x_ratio:.2f}, y={self.iris_y_ratio:.2f}"
-            cv2.putText(image, pos_text, (self.corners['outer'][0] - 150, self.corners['bottom'][1] + 20), 
+            cv2.putText(image, pos_text, (corners['outer'][0] - 150, corners['bottom'][1] + 20), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
 
 def getEyeRegions(face_landmarks, img_shape):
     """Create eye region objects for both eyes"""
-    left_eye = EyeRegion(face_landmarks, img_shape, is_left=True)
-    right_eye = EyeRegion(face_landmarks, img_shape, is_left=False)
+    ctx = FrameContext.of(face_landmarks, img_shape)
+    left_eye = EyeRegion(ctx, img_shape, is_left=True)
+    right_eye = EyeRegion(ctx, img_shape, is_left=False)
     return left_eye, right_eye
 
 def determineEyeGaze(left_eye, right_eye):
@@ -160,17 +180,17 @@ def determineEyeGaze(left_eye, right_eye):
     avg_y_ratio = (left_eye.iris_y_ratio + right_eye.iris_y_ratio) / 2
     
     # Determine horizontal gaze
-    if avg_x_ratio < 0.35:
+    if avg_x_ratio < GAZE_LEFT_THRESHOLD:
         horizontal_dir = "Left"
-    elif avg_x_ratio > 0.60:
+    elif avg_x_ratio > GAZE_RIGHT_THRESHOLD:
         horizontal_dir = "Right"
     else:
         horizontal_dir = "Center"
     
     # Determine vertical gaze
-    if avg_y_ratio < 0.35:
+    if avg_y_ratio < GAZE_UP_THRESHOLD:
         vertical_dir = "Up"
-    elif avg_y_ratio > 0.65:
+    elif avg_y_ratio > GAZE_DOWN_THRESHOLD:
         vertical_dir = "Down"
     else:
         vertical_dir = "Center"
@@ -183,7 +203,7 @@ def determineEyeGaze(left_eye, right_eye):
     
     # Determine if looking at screen
     out_of_screen = False
-    extreme_threshold = 0.15  # Threshold for extreme gaze
+    extreme_threshold = GAZE_EXTREME_THRESHOLD
     if avg_x_ratio < extreme_threshold or avg_x_ratio > (1 - extreme_threshold) or \
        avg_y_ratio < extreme_threshold or avg_y_ratio > (1 - extreme_threshold):
         out_of_screen = True
@@ -269,8 +289,13 @@ def drawGazeVisualization(image, left_eye, right_eye, gaze_info):
     cv2.arrowedLine(image, arrow_start, arrow_end, (0, 255, 0), 2, 
                     tipLength=0.3)
 
-def pipelineEyeGaze(image, face_landmarks):
-    """Process face landmarks to detect eye gaze direction"""
+def pipelineEyeGaze(image, face_landmarks, draw=None):
+    """
+    Process face landmarks to detect eye gaze direction
+
+    Args:
+        draw: Draw the overlays onto image; None uses the global default
+    """
     img_shape = image.shape
     
     # Get eye regions
@@ -278,11 +303,13 @@ def pipelineEyeGaze(image, face_landmarks):
     
     # Determine gaze direction
     gaze_info = determineEyeGaze(left_eye, right_eye)
+    left_eye.ctx.gaze_info = gaze_info
     
-    # Draw visualization
-    drawGazeVisualization(image, left_eye, right_eye, gaze_info)
-    
-    # Optional: Uncomment to add attention map overlay
-    # image = drawAttentionMap(image, gaze_info)
+    # Draw visualization (Optional)
+    if shouldRender(draw):
+        drawGazeVisualization(image, left_eye, right_eye, gaze_info)
+        
+        # Optional: Uncomment to add attention map overlay
+        # image = drawAttentionMap(image, gaze_info)
     
     return gaze_info
\ No newline at end of file
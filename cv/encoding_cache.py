@@ -0,0 +1,179 @@
+import atexit
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+import face_recognition
+import numpy as np
+
+from file_lock import file_lock
+
+DEFAULT_CACHE_PATH = os.environ.get('ENCODING_CACHE_PATH', 'encoding_cache.npy')
+
+# One record per reference image: SHA-256 of the file bytes, last use time
+# and the 128-d face_recognition encoding
+ENCODING_RECORD_DTYPE = np.dtype([
+    ('key', 'S32'),
+    ('last_used', 'f8'),
+    ('encoding', 'f8', (128,)),
+])
+
+
+def image_key(image_bytes):
+    return hashlib.sha256(image_bytes).digest()
+
+
+def encoding_from_bytes(image_bytes):
+    """Compute the face encoding of an encoded image (JPEG/PNG bytes)"""
+    image = face_recognition.load_image_file(io.BytesIO(image_bytes))
+    face_encodings = face_recognition.face_encodings(image)
+    if len(face_encodings) == 0:
+        raise ValueError("No face detected in reference image")
+    return face_encodings[0]
+
+
+class EncodingCache:
+    """
+    Persistent reference-encoding cache keyed by image content hash
+
+    Entries live in one structured NumPy array saved as a .npy file, so a
+    hit is a hash of the image bytes plus a lookup instead of a HOG
+    detection and a face embedding. Hits only update last-use times in
+    memory; the file is rewritten (atomically, under a cross-process file
+    lock, merged with other processes' changes) on put() and close(). It
+    holds at most max_entries records; the least recently used one is
+    dropped first.
+
+    Args:
+        path: .npy file backing the cache
+        max_entries: Maximum number of cached encodings
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self._records = np.zeros(0, dtype=ENCODING_RECORD_DTYPE)
+        self._mtime = None
+        self._touched = {}  # key -> last_used of hits not yet written
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._reload_locked()
+            return len(self._records)
+
+    def get(self, key):
+        """Return the cached encoding for a key, or None"""
+        with self._lock:
+            self._reload_locked()
+            hits = np.flatnonzero(self._records['key'] == key)
+            if not len(hits):
+                return None
+            self._touched[key] = time.time()
+            return self._records['encoding'][hits[0]].copy()
+
+    def put(self, key, encoding):
+        """Store an encoding, evicting the least recently used entries if full"""
+        with self._lock, file_lock(self.path):
+            self._reload_locked(force=True)
+            self._apply_touched_locked()
+            records = self._records[self._records['key'] != key]
+            if len(records) >= self.max_entries:
+                keep = np.argsort(records['last_used'])[len(records) - self.max_entries + 1:]
+                records = records[np.sort(keep)]
+            record = np.zeros(1, dtype=ENCODING_RECORD_DTYPE)
+            record['key'] = key
+            record['last_used'] = time.time()
+            record['encoding'] = encoding
+            self._records = np.concatenate([records, record])
+            self._save_locked()
+
+    def close(self):
+        """Write last-use times of hits since the last save"""
+        with self._lock:
+            if not self._touched:
+                return
+            with file_lock(self.path):
+                self._reload_locked(force=True)
+                self._apply_touched_locked()
+                self._save_locked()
+
+    def encoding_for_bytes(self, image_bytes):
+        """Cached encoding of an encoded image, computing it on a miss"""
+        key = image_key(image_bytes)
+        encoding = self.get(key)
+        if encoding is None:
+            encoding = encoding_from_bytes(image_bytes)
+            self.put(key, encoding)
+        return encoding
+
+    def encoding_for_image(self, image_path):
+        """Cached encoding of a reference image file"""
+        with open(image_path, 'rb') as f:
+            return self.encoding_for_bytes(f.read())
+
+    def _reload_locked(self, force=False):
+        # Pick up entries written by other processes sharing the file
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime and not force:
+            return
+        try:
+            records = np.load(self.path, allow_pickle=False)
+        except (OSError, ValueError):
+            return  # unreadable or truncated file: rebuilt on the next save
+        if records.dtype == ENCODING_RECORD_DTYPE:
+            self._records = records
+        self._mtime = mtime
+
+    def _apply_touched_locked(self):
+        for key, last_used in self._touched.items():
+            hits = self._records['key'] == key
+            self._records['last_used'][hits] = np.maximum(self._records['last_used'][hits], last_used)
+        self._touched.clear()
+
+    def _save_locked(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, self._records, allow_pickle=False)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """Process-wide cache at ENCODING_CACHE_PATH"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EncodingCache()
+            atexit.register(_default_cache.close)
+        return _default_cache
+
+
+def load_reference_encoding(image_path, cache=None):
+    """
+    Encoding of the first face in a reference image, via the cache
+
+    Raises:
+        FileNotFoundError: If the image does not exist
+        ValueError: If no face is found in the image
+    """
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Reference image not found at {image_path}")
+    if cache is None:
+        cache = default_cache()
+    return cache.encoding_for_image(image_path)
@@ -0,0 +1,101 @@
+import csv
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class EventLogWriter:
+    """
+    Appends CSV rows to a log file from a background thread
+
+    write() only enqueues the row; the writer thread keeps the file open and
+    writes rows in batches, flushing to disk once batch_size rows are
+    pending or flush_interval seconds have passed. Rows are written in the
+    order they were queued.
+
+    Args:
+        path: CSV file to append to (the header is written by the caller)
+        max_queue: Rows that may wait in memory before the policy applies
+        flush_interval: Seconds before pending rows are flushed
+        batch_size: Pending rows that trigger an early flush
+        policy: 'block' makes write() wait for room (no row is ever lost);
+            'drop' discards the row and counts it in `dropped`
+    """
+
+    def __init__(self, path, max_queue=1024, flush_interval=1.0, batch_size=64, policy='block'):
+        if policy not in ('block', 'drop'):
+            raise ValueError(f"Unknown queue policy '{policy}'")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.policy = policy
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='event-log-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        """Queue one CSV row"""
+        if self._closed:
+            raise ValueError("Event log writer is closed")
+        if self.policy == 'block':
+            self._queue.put(row)
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=None):
+        """Block until every row queued so far is written and synced to disk"""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)  # always blocking: the marker must not be dropped
+        return done.wait(timeout)
+
+    def close(self):
+        """Write all pending rows and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            pending = 0
+            deadline = None  # when the oldest unflushed row must hit the file
+            while True:
+                try:
+                    timeout = max(0.0, deadline - time.monotonic()) if pending else None
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP or isinstance(item, threading.Event):
+                    self._sync(f)
+                    pending = 0
+                    if item is _STOP:
+                        return
+                    item.set()
+                    continue
+
+                if item is not None:
+                    writer.writerow(item)
+                    pending += 1
+                    if pending == 1:
+                        deadline = time.monotonic() + self.flush_interval
+                if pending and (pending >= self.batch_size or time.monotonic() >= deadline):
+                    f.flush()
+                    pending = 0
+
+    @staticmethod
+    def _sync(f):
+        f.flush()
+        os.fsync(f.fileno())
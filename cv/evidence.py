@@ -0,0 +1,88 @@
+import datetime
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import cv2
+
+
+class EvidenceWriter:
+    """
+    Saves suspicious frames as JPEGs on a thread pool
+
+    submit() copies the frame (so overlays drawn on it afterwards never
+    reach the saved image) and returns immediately; encoding and writing
+    happen on the pool. Each event type is saved at most once per
+    min_interval seconds, and file names carry a sequence number so frames
+    from the same second never overwrite each other.
+
+    Args:
+        directory: Output directory for the JPEGs
+        min_interval: Default seconds between saved frames of one event type
+        intervals: Optional {event_type: seconds} overrides
+        max_pending: Frames allowed to wait for the pool before new ones are skipped
+        workers: Encoder threads
+        jpeg_quality: cv2.IMWRITE_JPEG_QUALITY value
+    """
+
+    def __init__(self, directory, min_interval=1.0, intervals=None, max_pending=32,
+                 workers=2, jpeg_quality=90):
+        self.directory = directory
+        self.min_interval = min_interval
+        self.intervals = dict(intervals or {})
+        self.max_pending = max_pending
+        self.jpeg_quality = jpeg_quality
+        self.saved = 0
+        self.skipped = 0
+        self._last_saved = {}  # event_type -> monotonic time of the last accepted frame
+        self._pending = set()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='evidence')
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, frame, event_type):
+        """
+        Queue a frame for saving
+
+        Returns:
+            Path the frame will be written to, or None if it was rate limited
+        """
+        now = time.monotonic()
+        with self._lock:
+            interval = self.intervals.get(event_type, self.min_interval)
+            last = self._last_saved.get(event_type)
+            if (last is not None and now - last < interval) or len(self._pending) >= self.max_pending:
+                self.skipped += 1
+                return None
+            self._last_saved[event_type] = now
+            seq = next(self._seq)
+
+        stamp = datetime.datetime.now().strftime("%H%M%S")
+        path = os.path.join(self.directory, f"{event_type}_{stamp}_{seq:05d}.jpg")
+        future = self._executor.submit(self._write, path, frame.copy())
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return path
+
+    def flush(self, timeout=None):
+        """Wait until every submitted frame has been written"""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending, timeout=timeout)
+
+    def close(self):
+        """Write the remaining frames and stop the pool"""
+        self._executor.shutdown(wait=True)
+
+    def _write(self, path, frame):
+        cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            if future.exception() is None:
+                self.saved += 1
@@ -9,6 +9,7 @@ from g_helper import bgr2rgb, rgb2bgr, mirrorImage
 from fp_helper import pipelineHeadTiltPose, draw_face_landmarks_fp
 from ms_helper import pipelineMouthState
 from eg_helper import pipelineEyeGaze  # Import the new eye gaze module
+from frame_context import FrameContext
 
 # Initiate Camera
 cap = cv2.VideoCapture(0)
@@ -37,14 +38,17 @@ with mp_face_mesh.FaceMesh(
                 # FACE MESH ----------------------------------------
                 draw_face_landmarks_fp(image, face_landmarks)
 
+                # Landmarks converted once and shared by the analyzers
+                ctx = FrameContext(face_landmarks, image.shape)
+
                 # HEAD TILT POSE -----------------------------------
-                head_tilt_pose = pipelineHeadTiltPose(image, face_landmarks)
+                head_tilt_pose = pipelineHeadTiltPose(image, ctx)
 
                 # MOUTH STATE --------------------------------------
-                mouth_state = pipelineMouthState(image, face_landmarks)
+                mouth_state = pipelineMouthState(image, ctx)
 
                 # EYE GAZE DETECTION ------------------------------
-                gaze_info = pipelineEyeGaze(image, face_landmarks)
+                gaze_info = pipelineEyeGaze(image, ctx)
                 
                 # Display overall status at the bottom
                 status_text = f"Head: {head_tilt_pose} | Mouth: {mouth_state} | Gaze: {gaze_info['direction']} | Out of screen: {'Yes' if gaze_info['out_of_screen'] else 'No'}"
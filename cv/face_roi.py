@@ -0,0 +1,132 @@
+import time
+
+import cv2
+import numpy as np
+
+from frame_context import landmarksToArray
+
+
+class FaceRoiTracker:
+    """
+    Remembers where a session's face was and crops the next frame to it
+
+    After a frame with exactly one face, the next inference runs on a padded
+    square around that face, resized to crop_size x crop_size, instead of on
+    the full frame. Landmarks found in the crop are mapped back to
+    normalized full-frame coordinates, so the analyzers see the same numbers
+    they would get from a full-frame pass.
+
+    Full-frame inference is used when no face is tracked, when the crop
+    loses the face, while a second face is present, and at least every
+    full_frame_interval seconds so a second person entering the frame is
+    still seen. The interval is in seconds rather than frames because
+    clients send anywhere from 1 to 30 frames per second.
+
+    Crops and full frames should be fed to separate FaceMesh graphs: a
+    tracking-mode graph carries its face ROI over to the next image, and
+    that ROI is meaningless when the coordinate space changes.
+
+    Args:
+        crop_size: Side in pixels of the square fed to FaceMesh
+        padding: Margin added on each side, as a fraction of the face size
+        full_frame_interval: Force a full-frame pass at least this often (seconds)
+    """
+
+    def __init__(self, crop_size=256, padding=0.25, full_frame_interval=2.0):
+        self.crop_size = crop_size
+        self.padding = padding
+        self.full_frame_interval = full_frame_interval
+        self.box = None  # (x0, y0, side) in full-frame pixels
+        self.frame_shape = None  # (height, width) of the frame the box was found in
+        # First face of the last update and its normalized full-frame
+        # (N, 3) landmarks, reusable by FrameContext
+        self._face = None
+        self._points = None
+        self._last_full_frame = None
+
+    def crop(self, frame, now=None):
+        """
+        Args:
+            now: time.monotonic() value; defaults to the current time
+
+        Returns:
+            (crop, box) for the tracked face, or (None, None) if the full
+            frame should be processed
+        """
+        now = time.monotonic() if now is None else now
+        if self.box is None or now - self._last_full_frame >= self.full_frame_interval:
+            return None, None
+        if frame.shape[:2] != self.frame_shape:
+            # Resolution changed (e.g. camera switch): the box may not fit
+            self.reset()
+            return None, None
+        x0, y0, side = self.box
+        crop = cv2.resize(frame[y0:y0 + side, x0:x0 + side], (self.crop_size, self.crop_size),
+                          interpolation=cv2.INTER_AREA)
+        return crop, self.box
+
+    def update(self, results, img_shape, box=None, now=None):
+        """
+        Map crop landmarks back to the full frame (in place) and remember
+        the face box for the next frame
+
+        Each face's landmarks are read into an array once; the box comes
+        from that array, and points_for() hands it on to FrameContext.
+
+        Args:
+            results: FaceMesh results for the crop, or for the full frame if box is None
+            box: The box returned by crop(), or None for a full-frame pass
+            now: time.monotonic() value; defaults to the current time
+
+        Returns:
+            Number of faces found
+        """
+        faces = results.multi_face_landmarks or []
+        img_h, img_w = img_shape[:2]
+        self._face = self._points = None
+        if box is None:
+            self._last_full_frame = time.monotonic() if now is None else now
+            if faces:
+                self._face, self._points = faces[0], landmarksToArray(faces[0])
+        else:
+            x0, y0, side = box
+            scale = np.array([side / img_w, side / img_h, side / img_w])  # z shares the x scale
+            offset = np.array([x0 / img_w, y0 / img_h, 0.0])
+            for i, face in enumerate(faces):
+                # Rounded through float32 like the protobuf fields, so a
+                # FrameContext built from either source is identical
+                points = (landmarksToArray(face) * scale + offset).astype(np.float32).astype(np.float64)
+                for lm, (x, y, z) in zip(face.landmark, points.tolist()):
+                    lm.x, lm.y, lm.z = x, y, z
+                if i == 0:
+                    self._face, self._points = face, points
+
+        # Only a lone face is tracked; otherwise every face must stay visible
+        self.box = self._face_box(self._points, img_w, img_h) if len(faces) == 1 else None
+        self.frame_shape = (img_h, img_w)
+        return len(faces)
+
+    def points_for(self, face_landmarks):
+        """Full-frame (N, 3) landmark array of a face from the last update, or None"""
+        return self._points if face_landmarks is self._face else None
+
+    def reset(self):
+        self.box = None
+        self.frame_shape = None
+        self._face = self._points = None
+        self._last_full_frame = None
+
+    def _face_box(self, points, img_w, img_h):
+        (left, top), (right, bottom) = points[:, :2].min(axis=0), points[:, :2].max(axis=0)
+        left, right = float(left) * img_w, float(right) * img_w
+        top, bottom = float(top) * img_h, float(bottom) * img_h
+        side = int(max(right - left, bottom - top) * (1 + 2 * self.padding))
+        if side <= 0 or side >= min(img_w, img_h):
+            return None  # face fills the frame; cropping would not help
+
+        # Square around the face center, shifted (not clipped) into the frame
+        x0 = int((left + right - side) / 2)
+        y0 = int((top + bottom - side) / 2)
+        x0 = min(max(x0, 0), img_w - side)
+        y0 = min(max(y0, 0), img_h - side)
+        return x0, y0, side
@@ -1,6 +1,8 @@
 import cv2
 import mediapipe as mp
 import numpy as np
+from g_helper import shouldRender
+from frame_context import FrameContext
 mp_drawing = mp.solutions.drawing_utils
 mp_drawing_styles = mp.solutions.drawing_styles
 mp_face_mesh = mp.solutions.face_mesh
@@ -25,21 +27,18 @@ def draw_face_landmarks_fp(image, face_landmarks):
         landmark_drawing_spec=None,
         connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_iris_connections_style())
 
+# Landmarks used for solvePnP: nose tip, eye corners, mouth corners and chin
+FP_INDICES = np.array([1, 33, 61, 199, 263, 291])
+NOSE_INDEX = 1
+
 def getCoordinates_fp(face_landmarks, img_h, img_w):
-    face_3d = []
-    face_2d = []
-    for idx, lm in enumerate(face_landmarks.landmark):
-        if idx == 33 or idx == 263 or idx == 1 or idx == 61 or idx == 291 or idx == 199:
-            if idx == 1:
-                nose_2d = (lm.x * img_w, lm.y * img_h)
-                nose_3d = (lm.x * img_w, lm.y * img_h, lm.z * 3000)
-            x, y = int(lm.x * img_w), int(lm.y * img_h)
-            face_2d.append([x, y])
-            face_3d.append([x, y, lm.z])
-    # Convert it to the NumPy array
-    face_2d = np.array(face_2d, dtype=np.float64)
-    # Convert it to the NumPy array
-    face_3d = np.array(face_3d, dtype=np.float64)
+    ctx = FrameContext.of(face_landmarks, (img_h, img_w))
+    # Integer pixel positions, as float64 for solvePnP
+    face_2d = ctx.pixels[FP_INDICES].astype(np.float64)
+    face_3d = np.column_stack((face_2d, ctx.points[FP_INDICES, 2]))
+    nose_x, nose_y, nose_z = ctx.points[NOSE_INDEX].tolist()
+    nose_2d = (nose_x, nose_y)
+    nose_3d = (nose_x, nose_y, nose_z * 3000)
     return face_2d, face_3d, nose_2d, nose_3d
 
 def projectCameraAngle_fp(face_2d, face_3d, img_h, img_w):
@@ -89,17 +88,20 @@ def draw_head_tilt_angle_fp(image, x, y, z):
     cv2.putText(image, "y: " + str(np.round(y,2)), (20, 275), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
     cv2.putText(image, "z: " + str(np.round(z,2)), (20, 300), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
-def pipelineHeadTiltPose(image, face_landmarks):
+def pipelineHeadTiltPose(image, face_landmarks, draw=None):
     # Get image shape
     img_h, img_w, img_c = image.shape
+    ctx = FrameContext.of(face_landmarks, image.shape)
     # Get face features coordinate
-    face_2d, face_3d, nose_2d, nose_3d = getCoordinates_fp(face_landmarks, img_h, img_w)
+    face_2d, face_3d, nose_2d, nose_3d = getCoordinates_fp(ctx, img_h, img_w)
     # Get camera angle
     x, y, z, rot_vec, trans_vec, cam_matrix, dist_matrix = projectCameraAngle_fp(face_2d, face_3d, img_h, img_w)
     # Get head tilt
     head_pose = getHeadTilt_fp(x, y, z)
-    # Draw nose projection and angle (Optional)
-    draw_nose_projection_fp(image, x, y, nose_2d, nose_3d, rot_vec, trans_vec, cam_matrix, dist_matrix)
-    draw_head_tilt_pose_fp(image, head_pose)
-    draw_head_tilt_angle_fp(image, x, y, z)
+    ctx.head_angles = (x, y, z)
+    # Draw nose projection and angle (Optional; draw=None uses the global default)
+    if shouldRender(draw):
+        draw_nose_projection_fp(image, x, y, nose_2d, nose_3d, rot_vec, trans_vec, cam_matrix, dist_matrix)
+        draw_head_tilt_pose_fp(image, head_pose)
+        draw_head_tilt_angle_fp(image, x, y, z)
     return head_pose
\ No newline at end of file
@@ -0,0 +1,56 @@
+import numpy as np
+
+
+def landmarksToArray(face_landmarks):
+    """Copy MediaPipe landmarks into an (N, 3) float64 array of normalized x, y, z"""
+    return np.array([(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark], dtype=np.float64)
+
+
+class FrameContext:
+    """
+    Per-frame landmark buffer shared by the eye gaze, head pose and mouth
+    analyzers
+
+    The protobuf landmark list is walked exactly once; analyzers then index
+    the arrays below with precomputed index arrays instead of doing their
+    own attribute lookups and int conversions.
+
+    Attributes:
+        points: (N, 3) float64 - x, y in pixels, z as reported by MediaPipe
+        pixels: (N, 2) int64 - x, y truncated to pixels like int(lm.x * w)
+        head_angles: (x, y, z) degrees, filled in by pipelineHeadTiltPose
+        lip_distance: Lower minus upper lip in pixels, filled in by pipelineMouthState
+        gaze_info: Filled in by pipelineEyeGaze
+    """
+
+    def __init__(self, face_landmarks, img_shape, normalized=None):
+        """
+        Args:
+            normalized: (N, 3) normalized landmarks already read from
+                face_landmarks (e.g. by FaceRoiTracker), to skip the protobuf walk
+        """
+        self.face_landmarks = face_landmarks
+        self.img_h, self.img_w = img_shape[:2]
+
+        self.points = landmarksToArray(face_landmarks) if normalized is None else np.array(normalized)
+        self.points[:, 0] *= self.img_w
+        self.points[:, 1] *= self.img_h
+        self.pixels = self.points[:, :2].astype(np.int64)
+
+        # Analyzer outputs
+        self.head_angles = None
+        self.lip_distance = None
+        self.gaze_info = None
+
+    def bounding_box(self):
+        """(x, y, w, h) pixel box around all landmarks"""
+        x0, y0 = self.pixels.min(axis=0)
+        x1, y1 = self.pixels.max(axis=0)
+        return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+    @classmethod
+    def of(cls, face_landmarks, img_shape):
+        """Return face_landmarks if it already is a FrameContext, else build one"""
+        if isinstance(face_landmarks, cls):
+            return face_landmarks
+        return cls(face_landmarks, img_shape)
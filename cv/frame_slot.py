@@ -0,0 +1,58 @@
+import threading
+
+
+class LatestFrameSlot:
+    """
+    Single-slot mailbox between a producer and a slower consumer
+
+    put() never blocks: a frame that has not been taken yet is replaced by
+    the newer one and counted as dropped, so the consumer always works on
+    the most recent frame instead of a growing backlog.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self.seq = 0
+        self.dropped = 0
+
+    def put(self, item):
+        """Publish an item, replacing any one not yet consumed; returns its sequence number"""
+        with self._cond:
+            if self._has_item:
+                self.dropped += 1
+            self.seq += 1
+            self._item = (self.seq, item)
+            self._has_item = True
+            self._cond.notify()
+            return self.seq
+
+    def get(self, timeout=None):
+        """
+        Take the newest item, waiting for one if necessary
+
+        Returns:
+            (seq, item), or None once the slot is closed and drained or
+            the timeout expires
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._has_item or self._closed, timeout):
+                return None
+            if not self._has_item:
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def close(self):
+        """Wake any waiting consumer; get() returns None once drained"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
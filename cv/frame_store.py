@@ -0,0 +1,170 @@
+"""
+Append-only binary log of per-frame metrics
+
+Each session's frames are stored as fixed-width records after a 16-byte
+header, so a log can be memory-mapped as a NumPy structured array and
+scanned without parsing:
+
+    frames = open_frame_store('frame_metrics/candidate-42-<hash>-<start>.frames')
+    risky = frames[frames['score'] >= 0.5]
+    print(frames['yaw'].mean(), np.bincount(frames['risk']))
+
+Missing values (no face, unscored frames) are NaN.
+"""
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b'PFRM'
+VERSION = 1
+HEADER = struct.Struct('<4sHHI4x')  # magic, version, header size, record size
+HEADER_SIZE = HEADER.size  # 16 bytes
+
+FRAME_RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('l_x_ratio', '<f4'), ('l_y_ratio', '<f4'),
+    ('r_x_ratio', '<f4'), ('r_y_ratio', '<f4'),
+    ('pitch', '<f4'), ('yaw', '<f4'), ('roll', '<f4'),
+    ('lip_distance', '<f4'),
+    ('gaze_score', '<f4'), ('head_score', '<f4'), ('mouth_score', '<f4'), ('face_score', '<f4'),
+    ('score', '<f4'),
+    ('num_faces', 'u1'),
+    ('risk', 'u1'),  # index into RISK_LEVELS
+    ('scored', 'u1'),  # 1 if the frame went through calculate_cheating_score
+    ('out_of_screen', 'u1'),
+])
+
+RISK_LEVELS = ("SAFE", "LOW RISK", "MEDIUM RISK", "HIGH RISK")
+_RISK_CODES = {level: code for code, level in enumerate(RISK_LEVELS)}
+
+_NAN = float('nan')
+
+
+def frame_record(timestamp, num_faces, result, gaze_info=None, head_angles=None,
+                 lip_distance=None, components=None):
+    """
+    Build one record (a tuple in FRAME_RECORD_DTYPE field order)
+
+    Args:
+        result: Result dict from score_frame
+        components: detector.last_components, used only for scored frames
+    """
+    scored = result.get('status') == 'success'
+    if gaze_info is not None:
+        ratios = (gaze_info['l_x_ratio'], gaze_info['l_y_ratio'],
+                  gaze_info['r_x_ratio'], gaze_info['r_y_ratio'])
+        out_of_screen = int(bool(gaze_info['out_of_screen']))
+    else:
+        ratios = (_NAN,) * 4
+        out_of_screen = 0
+    angles = tuple(head_angles) if head_angles is not None else (_NAN,) * 3
+    parts = tuple(components) if scored and components is not None else (_NAN,) * 4
+    return ((timestamp,) + ratios + angles
+            + (_NAN if lip_distance is None else lip_distance,)
+            + parts
+            + (result['score'], num_faces, _RISK_CODES.get(result['risk_level'], 0),
+               int(scored), out_of_screen))
+
+
+class FrameStoreWriter:
+    """
+    Batched appender for a frame log
+
+    Records are packed into a preallocated structured array and written
+    with one write() per batch, when batch_size records are pending or (at
+    the next append) the oldest pending record is flush_interval seconds
+    old. close() writes whatever is left; records appended after it (a
+    frame still in flight when its session is evicted) are dropped. An
+    existing log is appended to after its header is checked.
+
+    Args:
+        path: Log file
+        batch_size: Records buffered before a write
+        flush_interval: Seconds a record may wait in the buffer
+    """
+
+    def __init__(self, path, batch_size=256, flush_interval=2.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._buffer = np.zeros(batch_size, dtype=FRAME_RECORD_DTYPE)
+        self._pending = 0
+        self._oldest = None
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, HEADER_SIZE, FRAME_RECORD_DTYPE.itemsize))
+            self._file.flush()
+        else:
+            read_header(path)
+            # Drop a torn trailing record left by a crash so records stay aligned
+            size = self._file.tell()
+            aligned = size - (size - HEADER_SIZE) % FRAME_RECORD_DTYPE.itemsize
+            if aligned != size:
+                self._file.truncate(aligned)
+                self._file.seek(aligned)
+
+    def append(self, record):
+        """Buffer one record tuple (see frame_record)"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._buffer[self._pending] = record
+            self._pending += 1
+            now = time.monotonic()
+            if self._oldest is None:
+                self._oldest = now
+            if self._pending == len(self._buffer) or now - self._oldest >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_locked()
+            self._file.close()
+            self._file = None
+
+    def _flush_locked(self):
+        if self._pending:
+            self._file.write(self._buffer[:self._pending])  # buffer protocol, no tobytes() copy
+            self._pending = 0
+            self._oldest = None
+        self._file.flush()
+
+
+def read_header(path):
+    """Validate a log header; returns the record size"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise ValueError(f"{path}: truncated frame store header")
+    magic, version, header_size, record_size = HEADER.unpack(header)
+    if magic != MAGIC or header_size != HEADER_SIZE:
+        raise ValueError(f"{path}: not a frame store")
+    if version != VERSION or record_size != FRAME_RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path}: unsupported frame store version {version}")
+    return record_size
+
+
+def open_frame_store(path):
+    """
+    Memory-map a frame log as a read-only structured array (zero-copy)
+
+    Only complete records are mapped, so a log that is still being written
+    can be read at any time.
+    """
+    read_header(path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // FRAME_RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=FRAME_RECORD_DTYPE)
+    return np.memmap(path, dtype=FRAME_RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
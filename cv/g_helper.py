@@ -10,4 +10,16 @@ def rgb2bgr(image):
 
 def mirrorImage(image):
     image = cv2.flip(image, 1)
-    return image
\ No newline at end of file
+    return image
+
+# Global default for whether the pipeline helpers draw their overlays.
+# Servers that only need the metrics can switch this off; a per-call
+# draw=True/False argument still takes precedence.
+RENDER_OVERLAYS = True
+
+def setRenderOverlays(enabled):
+    global RENDER_OVERLAYS
+    RENDER_OVERLAYS = bool(enabled)
+
+def shouldRender(draw=None):
+    return RENDER_OVERLAYS if draw is None else draw
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+class IdentityGallery:
+    """
+    Face encodings of all registered candidates in one contiguous matrix
+
+    Row i of the matrix is the encoding of ids[i]. Rows are preallocated
+    and the matrix doubles when full; removing a candidate moves the last
+    row into the freed slot, so the live rows always stay packed. Squared
+    row norms are kept alongside, which turns a batched query into a single
+    matrix product:
+
+        |q - g|^2 = |q|^2 + |g|^2 - 2 q.g
+
+    Args:
+        capacity: Initially allocated rows
+        dim: Encoding length (128 for face_recognition)
+    """
+
+    def __init__(self, capacity=1024, dim=128):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float64)
+        self._sq_norms = np.zeros(capacity, dtype=np.float64)
+        self._ids = []
+        self._rows = {}  # candidate_id -> row
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, candidate_id):
+        return candidate_id in self._rows
+
+    @property
+    def ids(self):
+        with self._lock:
+            return list(self._ids)
+
+    def add(self, candidate_id, encoding):
+        """Add a candidate, replacing any encoding already stored for it"""
+        encoding = np.asarray(encoding, dtype=np.float64).reshape(self.dim)
+        with self._lock:
+            row = self._rows.get(candidate_id)
+            if row is None:
+                row = len(self._ids)
+                if row == len(self._matrix):
+                    self._grow_locked()
+                self._ids.append(candidate_id)
+                self._rows[candidate_id] = row
+            self._matrix[row] = encoding
+            self._sq_norms[row] = encoding @ encoding
+
+    def remove(self, candidate_id):
+        """Remove a candidate; returns True if it was present"""
+        with self._lock:
+            row = self._rows.pop(candidate_id, None)
+            if row is None:
+                return False
+            last = len(self._ids) - 1
+            if row != last:
+                # Move the last row into the hole to keep the matrix packed
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                moved = self._ids[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+            self._ids.pop()
+            return True
+
+    def query(self, encodings, k=5):
+        """
+        Nearest registered candidates for a batch of encodings
+
+        Args:
+            encodings: (M, dim) array of live encodings
+            k: Matches returned per query (capped at the gallery size)
+
+        Returns:
+            (ids, distances): (M, k) object array of candidate IDs and
+            (M, k) float array of Euclidean distances, nearest first
+        """
+        queries = np.asarray(encodings, dtype=np.float64).reshape(-1, self.dim)
+        with self._lock:
+            n = len(self._ids)
+            k = min(k, n)
+            if k == 0:
+                return np.empty((len(queries), 0), dtype=object), np.empty((len(queries), 0))
+            gallery = self._matrix[:n]
+            sq_dist = (queries * queries).sum(axis=1)[:, None] + self._sq_norms[:n][None, :]
+            sq_dist -= 2.0 * (queries @ gallery.T)
+            ids = np.array(self._ids, dtype=object)
+
+        np.maximum(sq_dist, 0.0, out=sq_dist)  # rounding can dip below zero
+        if k < n:
+            nearest = np.argpartition(sq_dist, k - 1, axis=1)[:, :k]
+        else:
+            nearest = np.broadcast_to(np.arange(n), sq_dist.shape)
+        nearest_sq = np.take_along_axis(sq_dist, nearest, axis=1)
+        order = np.argsort(nearest_sq, axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        distances = np.sqrt(np.take_along_axis(nearest_sq, order, axis=1))
+        return ids[nearest], distances
+
+    def save(self, path):
+        """Atomically write the gallery to an .npz file"""
+        with self._lock:
+            ids = np.array(self._ids, dtype=str)
+            encodings = self._matrix[:len(self._ids)].copy()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, ids=ids, encodings=encodings)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Read a gallery written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            ids, encodings = data['ids'], data['encodings']
+        gallery = cls(capacity=max(1024, len(ids)), dim=encodings.shape[1] if encodings.ndim == 2 else 128)
+        for candidate_id, encoding in zip(ids.tolist(), encodings):
+            gallery.add(candidate_id, encoding)
+        return gallery
+
+    def _grow_locked(self):
+        capacity = max(1, 2 * len(self._matrix))
+        matrix = np.zeros((capacity, self.dim), dtype=np.float64)
+        matrix[:len(self._matrix)] = self._matrix
+        sq_norms = np.zeros(capacity, dtype=np.float64)
+        sq_norms[:len(self._sq_norms)] = self._sq_norms
+        self._matrix, self._sq_norms = matrix, sq_norms
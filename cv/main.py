@@ -4,60 +4,95 @@ import time
 import datetime
 import face_recognition
 import dlib
-from scipy.spatial import distance as dist
 import threading
 import csv
 import os
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 
+from encoding_cache import load_reference_encoding
+from reverify import ReVerifier
+from event_log import EventLogWriter
+from evidence import EvidenceWriter
+from capture_pipeline import CapturePipeline
+from ring_buffer import RingBuffer
+
+
+def shape_to_array(shape):
+    """Convert a dlib 68-point shape into a (68, 2) int array in one pass"""
+    if isinstance(shape, np.ndarray):
+        return shape
+    return np.fromiter((c for p in shape.parts() for c in (p.x, p.y)),
+                       dtype=np.int64, count=2 * shape.num_parts).reshape(-1, 2)
+
+
 class ProctorSystem:
-    def __init__(self, reference_image_path, session_id=None):
+    def __init__(self, reference_image_path, session_id=None, reverify_interval=30.0, detect_scale=1.0,
+                 detect_upsample=1, sessions_dir="sessions"):
         """
         Initialize the proctoring system with a reference image
         
         Parameters:
         reference_image_path (str): Path to reference image for face verification
         session_id (str): Optional session identifier
+        reverify_interval (float): Seconds between identity re-checks during the session (0 disables)
+        detect_scale (float): Run face detection on the frame resized by this factor (e.g. 0.5)
+        detect_upsample (int): dlib upsampling passes; 1 (as face_recognition.face_locations
+            used for presence) finds smaller, more distant faces, 0 is faster
+        sessions_dir (str): Parent directory of the per-session output directory
         """
         self.session_id = session_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.reference_image = face_recognition.load_image_file(reference_image_path)
-        self.reference_encoding = face_recognition.face_encodings(self.reference_image)[0]
+        self.session_dir = os.path.join(sessions_dir, self.session_id)
+        # Cached by image hash, so restarting a session skips the HOG + embedding pass
+        self.reference_encoding = load_reference_encoding(reference_image_path)
         
         # Initialize metrics
         self.start_time = time.time()
         self.score = 100
         self.events = []
         self.verified = False
+        self.reverifier = ReVerifier(self.reference_encoding, reverify_interval) if reverify_interval else None
         
         # Detection parameters
         self.face_detector = dlib.get_frontal_face_detector()
+        self.detect_scale = detect_scale
+        self.detect_upsample = detect_upsample
         self.landmark_predictor = dlib.shape_predictor("shape_predictor_68_face_landmarks.dat")
         self.EYE_AR_THRESH = 0.2
         self.EYE_AR_CONSEC_FRAMES = 3
-        self.gaze_direction_history = []
-        self.head_pose_history = []
+        # Fixed-size histories with running sums: (left, right) iris positions
+        # over the last 10 frames, (eye/mouth, nose/chin) ratios over the last
+        # 20 with the 10 oldest as baseline and the 3 newest as current
+        self.gaze_direction_history = RingBuffer(10, 2)
+        self.head_pose_history = RingBuffer(20, 2, head=10, tail=3)
         self.absence_start_time = None
         self.is_absent = False
         
         # Setup output directories
         self.setup_output_dirs()
         
+        # Event rows are appended by a background writer, off the capture loop
+        self.event_writer = EventLogWriter(os.path.join(self.session_dir, "events.csv"))
+        
+        # Suspicious frames are encoded on a thread pool, at most one per event type per second
+        self.evidence_writer = EvidenceWriter(os.path.join(self.session_dir, "suspicious_frames"))
+        
         # Penalty weights
         self.penalties = {
             "absence": 10,  # Candidate not in frame
             "gaze_away": 5,  # Looking away from screen
             "unusual_head_pose": 5,  # Unusual head movement
             "multiple_faces": 15,  # Multiple faces detected
+            "identity_mismatch": 20,  # Face no longer matches the reference
         }
     
     def setup_output_dirs(self):
         """Create directories for output files"""
-        os.makedirs(f"sessions/{self.session_id}", exist_ok=True)
-        os.makedirs(f"sessions/{self.session_id}/suspicious_frames", exist_ok=True)
+        os.makedirs(self.session_dir, exist_ok=True)
+        os.makedirs(os.path.join(self.session_dir, "suspicious_frames"), exist_ok=True)
         
         # Initialize CSV log file
-        with open(f"sessions/{self.session_id}/events.csv", 'w', newline='') as f:
+        with open(os.path.join(self.session_dir, "events.csv"), 'w', newline='') as f:
             writer = csv.writer(f)
             writer.writerow(['Timestamp', 'Event', 'Penalty', 'Current Score'])
     
@@ -102,19 +137,15 @@ class ProctorSystem:
         Calculate the eye aspect ratio to determine eye openness
         
         Parameters:
-        eye_landmarks (list): List of (x,y) coordinates of eye landmarks
+        eye_landmarks (numpy.ndarray): (6, 2) array of (x,y) coordinates of eye landmarks
         
         Returns:
         float: Eye aspect ratio
         """
-        # Compute the euclidean distances between the two sets of
-        # vertical eye landmarks (x, y)-coordinates
-        A = dist.euclidean(eye_landmarks[1], eye_landmarks[5])
-        B = dist.euclidean(eye_landmarks[2], eye_landmarks[4])
-        
-        # Compute the euclidean distance between the horizontal
-        # eye landmark (x, y)-coordinates
-        C = dist.euclidean(eye_landmarks[0], eye_landmarks[3])
+        # Vertical pairs (1, 5) and (2, 4) and the horizontal pair (0, 3)
+        # in one vectorized distance computation
+        eye_landmarks = np.asarray(eye_landmarks)
+        A, B, C = np.hypot(*(eye_landmarks[[1, 2, 0]] - eye_landmarks[[5, 4, 3]]).T)
         
         # Compute the eye aspect ratio
         ear = (A + B) / (2.0 * C)
@@ -126,20 +157,15 @@ class ProctorSystem:
         
         Parameters:
         frame (numpy.ndarray): Current video frame
-        landmarks (dlib.full_object_detection): Facial landmarks
+        landmarks (numpy.ndarray or dlib.full_object_detection): Facial landmarks
         
         Returns:
         bool: True if looking away, False otherwise
         """
         # Get the left and right eye landmarks
-        left_eye = []
-        right_eye = []
-        
-        for i in range(36, 42):
-            left_eye.append((landmarks.part(i).x, landmarks.part(i).y))
-        
-        for i in range(42, 48):
-            right_eye.append((landmarks.part(i).x, landmarks.part(i).y))
+        points = shape_to_array(landmarks)
+        left_eye = points[36:42]
+        right_eye = points[42:48]
         
         # Calculate the eye aspect ratio
         left_ear = self.get_eye_aspect_ratio(left_eye)
@@ -188,13 +214,10 @@ class ProctorSystem:
         right_iris_position = right_iris_x / right_eye_width
         
         # Add to history
-        self.gaze_direction_history.append((left_iris_position, right_iris_position))
-        if len(self.gaze_direction_history) > 10:
-            self.gaze_direction_history.pop(0)
+        self.gaze_direction_history.push((left_iris_position, right_iris_position))
         
         # Average over recent history to reduce noise
-        avg_left = np.mean([p[0] for p in self.gaze_direction_history])
-        avg_right = np.mean([p[1] for p in self.gaze_direction_history])
+        avg_left, avg_right = self.gaze_direction_history.mean()
         
         # If iris is too far left or right in both eyes, consider looking away
         if (avg_left < 0.3 and avg_right < 0.3) or (avg_left > 0.7 and avg_right > 0.7):
@@ -207,23 +230,18 @@ class ProctorSystem:
         Estimate head pose to detect unusual movements
         
         Parameters:
-        landmarks (dlib.full_object_detection): Facial landmarks
+        landmarks (numpy.ndarray or dlib.full_object_detection): Facial landmarks
         
         Returns:
         bool: True if head pose is unusual, False otherwise
         """
-        # Get key facial landmarks for head pose estimation
-        nose_tip = (landmarks.part(30).x, landmarks.part(30).y)
-        chin = (landmarks.part(8).x, landmarks.part(8).y)
-        left_eye_left = (landmarks.part(36).x, landmarks.part(36).y)
-        right_eye_right = (landmarks.part(45).x, landmarks.part(45).y)
-        left_mouth = (landmarks.part(48).x, landmarks.part(48).y)
-        right_mouth = (landmarks.part(54).x, landmarks.part(54).y)
+        # Key facial landmarks for head pose estimation, as point pairs:
+        # outer eye corners (36, 45), mouth corners (48, 54), nose tip to chin (30, 8)
+        points = shape_to_array(landmarks)
         
         # Calculate simple metrics for head pose
-        eye_distance = dist.euclidean(left_eye_left, right_eye_right)
-        mouth_width = dist.euclidean(left_mouth, right_mouth)
-        nose_to_chin = dist.euclidean(nose_tip, chin)
+        eye_distance, mouth_width, nose_to_chin = np.hypot(
+            *(points[[36, 48, 30]] - points[[45, 54, 8]]).T)
         
         # Calculate proportions that should remain relatively stable
         # regardless of distance to camera
@@ -231,21 +249,17 @@ class ProctorSystem:
         nose_to_chin_ratio = nose_to_chin / eye_distance if eye_distance > 0 else 0
         
         # Add to history
-        self.head_pose_history.append((eye_to_mouth_ratio, nose_to_chin_ratio))
-        if len(self.head_pose_history) > 20:
-            self.head_pose_history.pop(0)
+        self.head_pose_history.push((eye_to_mouth_ratio, nose_to_chin_ratio))
         
         # Need enough history to make a determination
         if len(self.head_pose_history) < 10:
             return False
         
         # Calculate baseline (average of first 10 frames)
-        baseline_eye_mouth = np.mean([h[0] for h in self.head_pose_history[:10]])
-        baseline_nose_chin = np.mean([h[1] for h in self.head_pose_history[:10]])
+        baseline_eye_mouth, baseline_nose_chin = self.head_pose_history.head_mean()
         
         # Calculate current values (average of last 3 frames)
-        current_eye_mouth = np.mean([h[0] for h in self.head_pose_history[-3:]])
-        current_nose_chin = np.mean([h[1] for h in self.head_pose_history[-3:]])
+        current_eye_mouth, current_nose_chin = self.head_pose_history.tail_mean()
         
         # Check for significant deviation
         eye_mouth_deviation = abs(current_eye_mouth - baseline_eye_mouth) / baseline_eye_mouth
@@ -257,19 +271,42 @@ class ProctorSystem:
         
         return False
     
-    def check_presence(self, frame):
+    def detect_faces(self, gray):
+        """
+        Detect faces once per frame; the boxes feed every other check
+        
+        Parameters:
+        gray (numpy.ndarray): Grayscale video frame
+        
+        Returns:
+        list: dlib.rectangle boxes in full-frame coordinates
+        """
+        if self.detect_scale >= 1.0:
+            return list(self.face_detector(gray, self.detect_upsample))
+        
+        # Detect on a downscaled copy and map the boxes back
+        small = cv2.resize(gray, None, fx=self.detect_scale, fy=self.detect_scale,
+                           interpolation=cv2.INTER_AREA)
+        scale = 1.0 / self.detect_scale
+        return [dlib.rectangle(int(face.left() * scale), int(face.top() * scale),
+                               int(face.right() * scale), int(face.bottom() * scale))
+                for face in self.face_detector(small, self.detect_upsample)]
+    
+    def check_presence(self, frame, faces=None):
         """
         Check if candidate is present in the frame
         
         Parameters:
         frame (numpy.ndarray): Current video frame
+        faces (list): Face boxes already detected in this frame, if any
         
         Returns:
         bool: True if candidate is missing, False if present
         """
-        face_locations = face_recognition.face_locations(frame)
+        if faces is None:
+            faces = self.detect_faces(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
         
-        if not face_locations:
+        if not faces:
             # If no face detected
             if not self.is_absent:
                 self.absence_start_time = time.time()
@@ -284,7 +321,7 @@ class ProctorSystem:
             self.absence_start_time = None
             
             # Check for multiple faces
-            if len(face_locations) > 1:
+            if len(faces) > 1:
                 self.log_event("Multiple faces detected", self.penalties["multiple_faces"])
                 self.save_suspicious_frame(frame, "multiple_faces")
         
@@ -312,8 +349,14 @@ class ProctorSystem:
             
             return frame, identity_verified
         
+        # Convert to grayscale for face detection
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        
+        # Detect faces once; presence, identity, gaze and head pose share the boxes
+        faces = self.detect_faces(gray)
+        
         # Check for absence
-        if self.check_presence(frame):
+        if self.check_presence(frame, faces):
             self.log_event("Candidate absent from camera", self.penalties["absence"])
             self.save_suspicious_frame(frame, "absence")
             
@@ -321,15 +364,19 @@ class ProctorSystem:
             cv2.putText(frame, "CANDIDATE ABSENT", (10, 30), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         
-        # Convert to grayscale for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Detect faces
-        faces = self.face_detector(gray, 0)
+        # Re-verify identity on the detected face box at the configured cadence
+        if self.reverifier is not None:
+            box = None
+            if faces:
+                box = (faces[0].left(), faces[0].top(), faces[0].width(), faces[0].height())
+            identity = self.reverifier.update(frame, box, len(faces))
+            if identity is not None and not identity["verified"]:
+                self.log_event("Identity mismatch", self.penalties["identity_mismatch"])
+                self.save_suspicious_frame(frame, "identity_mismatch")
         
         for face in faces:
-            # Get facial landmarks
-            landmarks = self.landmark_predictor(gray, face)
+            # Get facial landmarks, converted once for every check below
+            landmarks = shape_to_array(self.landmark_predictor(gray, face))
             
             # Check gaze direction
             if self.detect_gaze_direction(gray, landmarks):
@@ -350,9 +397,7 @@ class ProctorSystem:
                             cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
             
             # Draw facial landmarks
-            for n in range(68):
-                x = landmarks.part(n).x
-                y = landmarks.part(n).y
+            for x, y in landmarks.tolist():
                 cv2.circle(frame, (x, y), 2, (0, 255, 0), -1)
         
         # Display current score
@@ -383,10 +428,8 @@ class ProctorSystem:
             'current_score': self.score
         })
         
-        # Write to CSV
-        with open(f"sessions/{self.session_id}/events.csv", 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([formatted_time, event_description, penalty, self.score])
+        # Queue the CSV row; the writer thread batches the file writes
+        self.event_writer.write([formatted_time, event_description, penalty, self.score])
     
     def save_suspicious_frame(self, frame, event_type):
         """
@@ -395,12 +438,12 @@ class ProctorSystem:
         Parameters:
         frame (numpy.ndarray): Current video frame
         event_type (str): Type of suspicious event
-        """
-        timestamp = time.time() - self.start_time
-        formatted_time = datetime.datetime.now().strftime("%H%M%S")
         
-        frame_path = f"sessions/{self.session_id}/suspicious_frames/{event_type}_{formatted_time}.jpg"
-        cv2.imwrite(frame_path, frame)
+        Returns:
+        str: Path the frame is written to, or None if rate limited
+        """
+        # A copy is queued, so later overlay drawing on frame is not saved
+        return self.evidence_writer.submit(frame, event_type)
     
     def generate_report(self):
         """
@@ -409,6 +452,10 @@ class ProctorSystem:
         Returns:
         dict: Report with verification status, events, score, and verdict
         """
+        # Make sure every logged event and saved frame is on disk before reporting
+        self.event_writer.flush()
+        self.evidence_writer.flush()
+        
         # Calculate session duration
         duration = time.time() - self.start_time
         formatted_duration = str(datetime.timedelta(seconds=int(duration)))
@@ -445,7 +492,7 @@ class ProctorSystem:
         plt.grid(True)
         plt.legend()
         plt.tight_layout()
-        plt.savefig(f"sessions/{self.session_id}/score_timeline.png")
+        plt.savefig(os.path.join(self.session_dir, "score_timeline.png"))
         
         # Count event types
         event_types = {}
@@ -463,14 +510,15 @@ class ProctorSystem:
             plt.ylabel('Count')
             plt.xticks(rotation=45, ha='right')
             plt.tight_layout()
-            plt.savefig(f"sessions/{self.session_id}/event_distribution.png")
+            plt.savefig(os.path.join(self.session_dir, "event_distribution.png"))
     
-    def run(self, camera_id=0):
+    def run(self, camera_id=0, pipelined=True):
         """
         Run the proctoring system with live webcam feed
         
         Parameters:
         camera_id (int): Camera device ID
+        pipelined (bool): Capture, analyze and display on separate threads
         """
         cap = cv2.VideoCapture(camera_id)
         
@@ -485,6 +533,57 @@ class ProctorSystem:
         print("Starting proctoring session...")
         print("Press 'q' to quit and generate report.")
         
+        if pipelined:
+            self.run_pipeline(cap)
+        else:
+            self.run_sequential(cap)
+        
+        # Clean up
+        cap.release()
+        cv2.destroyAllWindows()
+        
+        # Generate report
+        report = self.generate_report()
+        self.event_writer.close()
+        self.evidence_writer.close()
+        self.print_report(report)
+        
+        return report
+    
+    def run_pipeline(self, cap):
+        """
+        Threaded loop: the camera is drained continuously, analysis always
+        takes the newest frame and the display shows the newest result
+        
+        Parameters:
+        cap (cv2.VideoCapture): Opened camera
+        """
+        verification_failed = threading.Event()
+        
+        def process(frame):
+            processed_frame, continue_processing = self.process_frame(frame)
+            # Stop if identity verification failed
+            if not continue_processing and not self.verified:
+                verification_failed.set()
+                return processed_frame, False
+            return processed_frame, True
+        
+        pipeline = CapturePipeline(cap, process)
+        error = pipeline.run()
+        if error:
+            print(f"Error: {error}")
+        elif verification_failed.is_set():
+            print("Identity verification failed. Stopping session.")
+        print(f"Capture: {pipeline.capture_fps.count} frames, analysis: {pipeline.analysis_fps.count} frames "
+              f"({pipeline.fps_text()})")
+    
+    def run_sequential(self, cap):
+        """
+        Original single-threaded loop: read, process and display each frame in turn
+        
+        Parameters:
+        cap (cv2.VideoCapture): Opened camera
+        """
         while True:
             ret, frame = cap.read()
             
@@ -507,16 +606,6 @@ class ProctorSystem:
             key = cv2.waitKey(1) & 0xFF
             if key == ord('q'):
                 break
-        
-        # Clean up
-        cap.release()
-        cv2.destroyAllWindows()
-        
-        # Generate report
-        report = self.generate_report()
-        self.print_report(report)
-        
-        return report
     
     def print_report(self, report):
         """
@@ -543,7 +632,7 @@ class ProctorSystem:
                 print(f"[{event['timestamp']}] {event['description']} (-{event['penalty']} points)")
         
         print("-"*50)
-        print(f"Report saved to: sessions/{report['session_id']}/")
+        print(f"Report saved to: {self.session_dir}/")
         print("="*50)
 
 
@@ -558,6 +647,14 @@ def main():
                         help='Camera device ID (default: 0)')
     parser.add_argument('--session', '-s', type=str, default=None,
                         help='Session ID (default: auto-generated)')
+    parser.add_argument('--reverify-interval', type=float, default=30.0,
+                        help='Seconds between identity re-checks during the exam, 0 to disable (default: 30)')
+    parser.add_argument('--detect-scale', type=float, default=1.0,
+                        help='Detect faces on the frame resized by this factor, e.g. 0.5 (default: 1.0)')
+    parser.add_argument('--detect-upsample', type=int, default=1,
+                        help='dlib upsampling passes for face detection; 0 is faster but misses small faces (default: 1)')
+    parser.add_argument('--sequential', action='store_true',
+                        help='Capture, analyze and display in one loop instead of a threaded pipeline')
     
     args = parser.parse_args()
     
@@ -575,10 +672,11 @@ def main():
         return
     
     # Create proctoring system
-    proctor = ProctorSystem(args.reference, args.session)
+    proctor = ProctorSystem(args.reference, args.session, args.reverify_interval, args.detect_scale,
+                            args.detect_upsample)
     
     # Run proctoring
-    proctor.run(args.camera)
+    proctor.run(args.camera, pipelined=not args.sequential)
 
 
 if __name__ == "__main__":
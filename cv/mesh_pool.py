@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import mediapipe as mp
+mp_face_mesh = mp.solutions.face_mesh
+
+
+# FaceMesh settings used for server-side analysis
+FACE_MESH_OPTIONS = {
+    'max_num_faces': 2,
+    'refine_landmarks': True,  # Important for iris detection
+    'min_detection_confidence': 0.5,
+    'min_tracking_confidence': 0.5,
+}
+
+
+class MeshPoolExhausted(RuntimeError):
+    """Raised when every pooled FaceMesh is busy and the pool is at capacity"""
+
+
+class _MeshEntry:
+    def __init__(self, face_mesh):
+        self.face_mesh = face_mesh
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.face_mesh.close()
+
+
+class FaceMeshPool:
+    """
+    Keeps one long-lived FaceMesh per session so MediaPipe can stay in
+    tracking mode between frames instead of re-running detection on every
+    request.
+
+    Args:
+        max_instances: Hard cap on the number of live FaceMesh graphs
+        idle_timeout: Seconds after which an unused instance is closed
+        **mesh_kwargs: Options passed to mp_face_mesh.FaceMesh
+    """
+
+    def __init__(self, max_instances=32, idle_timeout=120.0, **mesh_kwargs):
+        self.max_instances = max_instances
+        self.idle_timeout = idle_timeout
+        self.mesh_kwargs = dict(FACE_MESH_OPTIONS, **mesh_kwargs)
+        self._entries = OrderedDict()  # session_id -> _MeshEntry, oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @contextmanager
+    def acquire(self, session_id):
+        """Borrow the session's FaceMesh, creating it if needed"""
+        while True:
+            entry = self._get_entry(session_id)
+            entry.lock.acquire()
+            if not entry.closed:
+                break
+            # Evicted between lookup and lock; look it up again
+            entry.lock.release()
+
+        try:
+            yield entry.face_mesh
+        finally:
+            entry.last_used = time.monotonic()
+            entry.lock.release()
+
+    def _get_entry(self, session_id):
+        with self._lock:
+            self._evict_idle_locked(time.monotonic())
+            entry = self._entries.get(session_id)
+            if entry is None:
+                if len(self._entries) >= self.max_instances:
+                    self._evict_lru_locked()
+                entry = _MeshEntry(mp_face_mesh.FaceMesh(**self.mesh_kwargs))
+                self._entries[session_id] = entry
+            else:
+                self._entries.move_to_end(session_id)
+            return entry
+
+    def release(self, session_id):
+        """Close and forget the FaceMesh owned by a session"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            with entry.lock:
+                entry.close()
+
+    def evict_idle(self):
+        """Close every instance that has been idle longer than idle_timeout"""
+        with self._lock:
+            self._evict_idle_locked(time.monotonic())
+
+    def close(self):
+        """Close all pooled instances"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            with entry.lock:
+                entry.close()
+
+    def _evict_idle_locked(self, now):
+        for session_id, entry in list(self._entries.items()):
+            if now - entry.last_used <= self.idle_timeout:
+                break  # entries are kept in LRU order
+            if entry.lock.acquire(blocking=False):
+                try:
+                    entry.close()
+                finally:
+                    entry.lock.release()
+                del self._entries[session_id]
+
+    def _evict_lru_locked(self):
+        for session_id, entry in self._entries.items():
+            if entry.lock.acquire(blocking=False):
+                try:
+                    entry.close()
+                finally:
+                    entry.lock.release()
+                del self._entries[session_id]
+                return
+        raise MeshPoolExhausted(f"All {self.max_instances} FaceMesh instances are busy")
@@ -0,0 +1,145 @@
+import threading
+from bisect import bisect_left
+
+# Latency buckets in seconds, from sub-millisecond analyzers to slow inference
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                           0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+
+class Counter:
+    """Monotonic counter"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=None):
+        self.name = name
+        self.help = help_text
+        self.labels = dict(labels or {})
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, const_labels):
+        yield self.name, {**const_labels, **self.labels}, self.value
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, read, labels=None):
+        self.name = name
+        self.help = help_text
+        self.labels = dict(labels or {})
+        self.read = read
+
+    def samples(self, const_labels):
+        yield self.name, {**const_labels, **self.labels}, self.read()
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram
+
+    Bucket counts live in a preallocated list, so observe() is a bisect and
+    two additions with no per-call allocation.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=None, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = dict(labels or {})
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, const_labels):
+        labels = {**const_labels, **self.labels}
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield self.name + '_bucket', {**labels, 'le': repr(float(bound))}, cumulative
+        yield self.name + '_bucket', {**labels, 'le': '+Inf'}, count
+        yield self.name + '_sum', labels, total
+        yield self.name + '_count', labels, count
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.metrics = []
+        self.const_labels = {}  # added to every sample, e.g. {'worker': '0'}
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=None):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, read, labels=None):
+        return self.register(Gauge(name, help_text, read, labels))
+
+    def histogram(self, name, help_text, labels=None, buckets=DEFAULT_LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        # Metrics sharing a name (different labels) form one family
+        families = {}
+        for metric in self.metrics:
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name, members in families.items():
+            lines.append(f"# HELP {name} {members[0].help}")
+            lines.append(f"# TYPE {name} {members[0].kind}")
+            for metric in members:
+                for sample_name, labels, value in metric.samples(self.const_labels):
+                    lines.append(f"{sample_name}{format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def merge_expositions(texts):
+    """Merge several Prometheus text expositions, keeping each family contiguous"""
+    families = {}
+    current = None
+    for text in texts:
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                current = line.split(' ', 3)[2]
+                header = families.setdefault(current, {'header': [], 'samples': []})['header']
+                if line not in header:
+                    header.append(line)
+            elif current is not None:
+                families[current]['samples'].append(line)
+    lines = []
+    for family in families.values():
+        lines.extend(family['header'])
+        lines.extend(family['samples'])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,52 @@
+import cv2
+
+
+class MotionGate:
+    """
+    Cheap scene-change detector used to skip redundant frame analysis
+
+    Each frame is shrunk to a tiny grayscale thumbnail and compared with the
+    thumbnail of the last frame that was actually analyzed. While the mean
+    absolute difference stays under the threshold the frame can reuse the
+    previous metrics, but never more than max_skip frames in a row.
+
+    Args:
+        threshold: Mean absolute gray-level difference (0-255) that counts as change
+        max_skip: Longest run of skipped frames before analysis is forced
+        size: Thumbnail (width, height)
+    """
+
+    def __init__(self, threshold=3.0, max_skip=4, size=(32, 24)):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.size = size
+        self._reference = None
+        self._skipped = 0
+        self.last_difference = None
+
+    def thumbnail(self, frame):
+        # Shrink first so the color conversion only touches a few hundred pixels
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def should_skip(self, frame):
+        """
+        Returns True if the frame can reuse the last analysis; otherwise the
+        frame becomes the new reference and must be analyzed
+        """
+        thumb = self.thumbnail(frame)
+        if self._reference is not None and self._skipped < self.max_skip:
+            self.last_difference = cv2.norm(thumb, self._reference, cv2.NORM_L1) / thumb.size
+            if self.last_difference < self.threshold:
+                self._skipped += 1
+                return True
+        self._reference = thumb
+        self._skipped = 0
+        return False
+
+    def reset(self):
+        """Force analysis of the next frame"""
+        self._reference = None
+        self._skipped = 0
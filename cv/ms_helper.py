@@ -1,24 +1,14 @@
 import cv2
 import mediapipe as mp
 import numpy as np
+from g_helper import shouldRender
+from frame_context import FrameContext
 mp_drawing = mp.solutions.drawing_utils
 mp_drawing_styles = mp.solutions.drawing_styles
 mp_face_mesh = mp.solutions.face_mesh
 
-def getCoordinates_ms(idx, landmark, img_h, img_w, upper_loc, upper_x, lower_loc, lower_x):
-    x, y = landmark.x, landmark.y
-    x_on_image = int(x*img_w)
-    y_on_image = int(y*img_h)
-    
-    upper_lip_index = 0
-    lower_lip_index = 14
-    if idx == upper_lip_index:
-        upper_loc = y_on_image
-        upper_x = x_on_image
-    elif idx == lower_lip_index:
-        lower_loc = y_on_image
-        lower_x = x_on_image
-    return upper_loc, upper_x, lower_loc, lower_x
+# Upper and lower inner lip landmarks
+MOUTH_INDICES = [0, 14]
 
 def getMouthState_ms(upper_lip_loc, lower_lip_loc):
     distance = int(lower_lip_loc - upper_lip_loc)
@@ -38,22 +28,17 @@ def draw_mouth_condition_ms(image, upper_lip_loc, lower_lip_loc, distance):
     cv2.putText(image, f"upper/lower: {upper_lip_loc}/{lower_lip_loc}", (20, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 2)
     cv2.putText(image, f"distance: {distance}", (20, 175), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 2)
 
-def pipelineMouthState(image, face_landmarks):
-    # Get image shape
-    img_h, img_w, img_c = image.shape
-    landmark_points = face_landmarks.landmark
-    upper_lip_loc = 0
-    upper_x = 0
-    lower_lip_loc = 0
-    lower_x = 0
-    for idx, landmark in enumerate(landmark_points):
-        # Get lips location coordinate
-        upper_lip_loc, upper_x, lower_lip_loc, lower_x = getCoordinates_ms(idx, landmark, img_h, img_w, upper_lip_loc, upper_x, lower_lip_loc, lower_x)
+def pipelineMouthState(image, face_landmarks, draw=None):
+    ctx = FrameContext.of(face_landmarks, image.shape)
+    # Get lips location coordinate
+    (upper_x, upper_lip_loc), (lower_x, lower_lip_loc) = ctx.pixels[MOUTH_INDICES].tolist()
     # Get mouth state
     mouthState, distance = getMouthState_ms(upper_lip_loc, lower_lip_loc)
-    # Draw mouth state (Optional)
-    draw_mouth_state_ms(image, mouthState)
-    draw_mouth_condition_ms(image, upper_lip_loc, lower_lip_loc, distance)
-    draw_mouth_lips_dots_ms(image, upper_x, upper_lip_loc)
-    draw_mouth_lips_dots_ms(image, lower_x, lower_lip_loc)
+    ctx.lip_distance = distance
+    # Draw mouth state (Optional; draw=None uses the global default)
+    if shouldRender(draw):
+        draw_mouth_state_ms(image, mouthState)
+        draw_mouth_condition_ms(image, upper_lip_loc, lower_lip_loc, distance)
+        draw_mouth_lips_dots_ms(image, upper_x, upper_lip_loc)
+        draw_mouth_lips_dots_ms(image, lower_x, lower_lip_loc)
     return mouthState
\ No newline at end of file
@@ -0,0 +1,116 @@
+import time
+
+import cv2
+import face_recognition
+
+
+def encode_face_box(frame, box, margin=0.25):
+    """
+    Face encoding for a known face box, without a HOG face_locations scan
+
+    Only a margin-padded crop around the box is converted and passed to
+    face_recognition, with the box as the known face location.
+
+    Args:
+        frame: BGR image
+        box: (x, y, w, h) face box in frame pixels, e.g. from the landmarks
+        margin: Extra context around the box, as a fraction of its size
+
+    Returns:
+        128-d encoding, or None if the box is empty
+    """
+    img_h, img_w = frame.shape[:2]
+    x, y, w, h = box
+    pad_x, pad_y = int(w * margin), int(h * margin)
+    left, top = max(0, x - pad_x), max(0, y - pad_y)
+    right, bottom = min(img_w, x + w + pad_x), min(img_h, y + h + pad_y)
+    if right <= left or bottom <= top:
+        return None
+
+    crop = cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2RGB)
+    # face_recognition locations are (top, right, bottom, left) in crop pixels
+    location = (max(0, y - top), min(right, x + w) - left, min(bottom, y + h) - top, max(0, x - left))
+    encodings = face_recognition.face_encodings(crop, [location])
+    return encodings[0] if encodings else None
+
+
+class ReVerifier:
+    """
+    Periodic identity re-verification during a session
+
+    Called on every analyzed frame with the face box the landmark pipeline
+    already produced; an encoding is computed only when a check is due:
+    every `interval` seconds, or right away on a suspected face swap (the
+    face reappearing after an absence, a second face, or the face box
+    jumping by more than its own width between frames).
+
+    Args:
+        reference_encoding: 128-d encoding of the registered candidate
+        interval: Seconds between routine checks
+        tolerance: Maximum face distance that still counts as a match
+    """
+
+    def __init__(self, reference_encoding, interval=30.0, tolerance=0.6):
+        self.reference_encoding = reference_encoding
+        self.interval = interval
+        self.tolerance = tolerance
+        self.last_checked = None
+        self.last_result = None
+        self.last_encoding = None
+        self.checks = 0
+        self.mismatches = 0
+        self._last_box = None
+        self._last_faces = None
+        self._force = True  # first face seen is always checked
+
+    def suspect_swap(self, num_faces, box):
+        """Flag the next check as forced if this frame looks like a face swap"""
+        if num_faces > 1 or (num_faces and self._last_faces == 0):
+            self._force = True
+        elif box is not None and self._last_box is not None:
+            x, y, w, _ = box
+            last_x, last_y, last_w, _ = self._last_box
+            if abs(x - last_x) > last_w or abs(y - last_y) > last_w:
+                self._force = True
+        self._last_faces = num_faces
+        self._last_box = box
+
+    def due(self, now):
+        return self._force or self.last_checked is None or now - self.last_checked >= self.interval
+
+    def update(self, frame, box, num_faces, now=None):
+        """
+        Track the frame and re-verify if a check is due
+
+        Args:
+            frame: BGR frame the box refers to
+            box: (x, y, w, h) of the primary face, or None if no face
+
+        Returns:
+            Result dict if a check ran on this frame, else None
+        """
+        now = time.time() if now is None else now
+        self.suspect_swap(num_faces, box)
+        if box is None or not self.due(now):
+            return None
+
+        encoding = encode_face_box(frame, box)
+        if encoding is None:
+            return None
+        distance = float(face_recognition.face_distance([self.reference_encoding], encoding)[0])
+        verified = distance <= self.tolerance
+
+        self.last_checked = now
+        self.last_encoding = encoding
+        self._force = False
+        self.checks += 1
+        if not verified:
+            self.mismatches += 1
+        self.last_result = {
+            "verified": verified,
+            "distance": distance,
+            "checked_at": now,
+            "checks": self.checks,
+            "mismatches": self.mismatches,
+        }
+        return self.last_result
@@ -0,0 +1,95 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-size history of float rows with running sums
+
+    Rows live in a preallocated (capacity, width) array. Besides the sum of
+    all rows, running sums of the `head` oldest and `tail` newest rows are
+    kept, so mean(), head_mean() and tail_mean() cost the same for any
+    window length. The sums are recomputed from the buffer once every
+    `capacity` pushes so floating-point drift cannot build up.
+
+    Args:
+        capacity: Maximum number of rows kept (oldest rows are overwritten)
+        width: Values per row
+        head: Size of the oldest-rows window (0 disables it)
+        tail: Size of the newest-rows window (0 disables it)
+    """
+
+    def __init__(self, capacity, width=1, head=0, tail=0):
+        self.capacity = capacity
+        self.head = min(head, capacity)
+        self.tail = min(tail, capacity)
+        self._data = np.zeros((capacity, width), dtype=np.float64)
+        self._sum = np.zeros(width, dtype=np.float64)
+        self._head_sum = np.zeros(width, dtype=np.float64)
+        self._tail_sum = np.zeros(width, dtype=np.float64)
+        self._start = 0  # physical index of the oldest row
+        self._len = 0
+        self._pushes = 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        """Row by logical index: 0 is the oldest, -1 the newest"""
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("ring buffer index out of range")
+        return self._data[(self._start + index) % self.capacity]
+
+    def push(self, row):
+        """Append a row, overwriting the oldest one when full"""
+        full = self._len == self.capacity
+        end = (self._start + self._len) % self.capacity
+        if full:
+            # end == _start: the oldest row is about to be overwritten
+            self._sum -= self._data[end]
+            if self.head:
+                self._head_sum -= self._data[end]
+        self._data[end] = row
+        self._sum += self._data[end]
+        if full:
+            self._start = (self._start + 1) % self.capacity
+        else:
+            self._len += 1
+
+        if self.head:
+            if full:
+                # The row that just became the head window's newest member
+                self._head_sum += self[self.head - 1]
+            elif self._len <= self.head:
+                self._head_sum += self._data[end]
+        if self.tail:
+            self._tail_sum += self._data[end]
+            if self._len > self.tail:
+                self._tail_sum -= self[-self.tail - 1]
+
+        self._pushes += 1
+        if self._pushes % self.capacity == 0:
+            self._resum()
+
+    def clear(self):
+        self._start = self._len = self._pushes = 0
+        self._sum[:] = self._head_sum[:] = self._tail_sum[:] = 0.0
+
+    def mean(self):
+        """Per-column mean of all rows"""
+        return self._sum / self._len
+
+    def head_mean(self):
+        """Per-column mean of the `head` oldest rows (fewer while filling)"""
+        return self._head_sum / min(self._len, self.head)
+
+    def tail_mean(self):
+        """Per-column mean of the `tail` newest rows (fewer while filling)"""
+        return self._tail_sum / min(self._len, self.tail)
+
+    def _resum(self):
+        rows = np.roll(self._data, -self._start, axis=0)[:self._len]
+        self._sum[:] = rows.sum(axis=0)
+        self._head_sum[:] = rows[:self.head].sum(axis=0)
+        self._tail_sum[:] = rows[max(0, self._len - self.tail):].sum(axis=0) if self.tail else 0.0
@@ -0,0 +1,235 @@
+import threading
+
+import numpy as np
+
+# Component order in the windows and in the returned component arrays
+COMPONENTS = ('eye_gaze', 'head_tilt', 'mouth_movement')
+
+# Scoring configuration shared with CheatingDetector, which copies these
+# defaults; tune them here so scalar and batched scores stay identical
+SCORING_WEIGHTS = {
+    'eye_gaze': 0.4,
+    'head_tilt': 0.3,
+    'mouth_movement': 0.2,
+    'face_presence': 0.1
+}
+SUSPICIOUS_GAZE = ('Left', 'Right', 'Up', 'Down')
+SUSPICIOUS_HEAD_TILT = ('Left', 'Right', 'Up', 'Down')
+SUSPICIOUS_MOUTH = ('Open', 'Talking')
+HISTORY_WINDOW = 10
+
+# Status thresholds of CheatingDetector.get_cheating_status, highest first
+STATUS_THRESHOLDS = ((0.8, "HIGH RISK"), (0.5, "MEDIUM RISK"), (0.3, "LOW RISK"))
+STATUS_DEFAULT = "SAFE"
+
+
+def categoryTable(suspicious, neutral):
+    """
+    Lookup table reproducing CheatingDetector's per-category scores:
+    suspicious states 0.8, the neutral state 0.0, anything else 0.4
+    """
+    table = {state: 0.8 for state in suspicious}
+    table.setdefault(neutral, 0.0)
+    return table
+
+
+class ScoringEngine:
+    """
+    Cheating scores for many sessions in one vectorized step
+
+    Every session owns a slot in preallocated arrays holding its gaze, head
+    tilt and mouth smoothing windows (slots x 3 x window). Categorical
+    states are mapped to component scores through lookup tables, and a
+    batch of sessions' new frames is scored with a handful of NumPy
+    operations regardless of how many sessions are in the batch.
+
+    Scores are bit-for-bit identical to CheatingDetector.calculate_cheating_score:
+    each window is summed oldest-first exactly like sum(deque), instead of
+    keeping add/subtract running sums whose last-bit drift could move a
+    score across a status threshold. That costs `window` vectorized adds
+    per batch, independent of the number of sessions.
+
+    The live server binds every session's detector to one engine and
+    scores concurrent requests together through a ScoreBatcher.
+
+    Args:
+        capacity: Initially allocated session slots (grows when exhausted)
+        window: Smoothing window length
+        weights: Component weights; defaults to SCORING_WEIGHTS
+        suspicious_gaze / suspicious_head_tilt / suspicious_mouth: State lists
+            scored 0.8
+    """
+
+    def __init__(self, capacity=256, window=HISTORY_WINDOW, weights=None,
+                 suspicious_gaze=SUSPICIOUS_GAZE,
+                 suspicious_head_tilt=SUSPICIOUS_HEAD_TILT,
+                 suspicious_mouth=SUSPICIOUS_MOUTH):
+        self.window = window
+        self.weights = dict(weights or SCORING_WEIGHTS)
+        self.gaze_table = categoryTable(suspicious_gaze, "Center")
+        self.head_table = categoryTable(suspicious_head_tilt, "Center")
+        self.mouth_table = categoryTable(suspicious_mouth, "Closed")
+
+        self._windows = np.zeros((capacity, len(COMPONENTS), window), dtype=np.float64)
+        self._start = np.zeros(capacity, dtype=np.int64)  # oldest entry of each window
+        self._length = np.zeros(capacity, dtype=np.int64)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        """Reserve an empty slot for a new session"""
+        with self._lock:
+            if not self._free:
+                self._grow_locked()
+            slot = self._free.pop()
+            self._start[slot] = 0
+            self._length[slot] = 0
+            return slot
+
+    def release(self, slot):
+        with self._lock:
+            self._free.append(slot)
+
+    def encode(self, gaze_infos, head_tilts, mouth_states):
+        """Map analyzer outputs of a batch to (B, 3) component scores"""
+        scores = np.empty((len(gaze_infos), len(COMPONENTS)), dtype=np.float64)
+        scores[:, 0] = [1.0 if g['out_of_screen'] else self.gaze_table.get(g['direction'], 0.4)
+                        for g in gaze_infos]
+        scores[:, 1] = [self.head_table.get(h, 0.4) for h in head_tilts]
+        scores[:, 2] = [self.mouth_table.get(m, 0.4) for m in mouth_states]
+        return scores
+
+    def score(self, slots, component_scores, face_scores):
+        """
+        Push one frame per session and score the batch
+
+        Args:
+            slots: (B,) distinct session slots
+            component_scores: (B, 3) gaze, head tilt and mouth scores of the new frames
+            face_scores: (B,) face presence scores
+
+        Returns:
+            (totals, averages): (B,) weighted scores and (B, 3) smoothed components
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(np.unique(slots)) != len(slots):
+            raise ValueError("Each session may appear only once per batch")
+        face_scores = np.asarray(face_scores, dtype=np.float64)
+
+        with self._lock:
+            start, length = self._start[slots], self._length[slots]
+            full = length == self.window
+            # Append, overwriting the oldest entry of full windows
+            self._windows[slots, :, (start + length) % self.window] = component_scores
+            start = np.where(full, (start + 1) % self.window, start)
+            length = np.where(full, length, length + 1)
+            self._start[slots], self._length[slots] = start, length
+            windows = self._windows[slots]
+
+        # Sum oldest-first like sum(deque); entries past the length add 0.0
+        positions = np.arange(self.window)
+        order = (start[:, None] + positions[None, :]) % self.window
+        ordered = np.take_along_axis(windows, order[:, None, :], axis=2)
+        ordered[np.broadcast_to((positions[None, :] >= length[:, None])[:, None, :], ordered.shape)] = 0.0
+        sums = np.zeros(ordered.shape[:2], dtype=np.float64)
+        for j in range(self.window):
+            sums += ordered[:, :, j]
+        averages = sums / length[:, None]
+
+        # Same evaluation order as the scalar weighted sum
+        w = self.weights
+        totals = (averages[:, 0] * w['eye_gaze'] +
+                  averages[:, 1] * w['head_tilt'] +
+                  averages[:, 2] * w['mouth_movement'] +
+                  face_scores * w['face_presence'])
+        return totals, averages
+
+    @staticmethod
+    def statuses(totals):
+        """Vectorized get_cheating_status labels for an array of scores"""
+        totals = np.asarray(totals)
+        labels = np.full(totals.shape, STATUS_DEFAULT, dtype=object)
+        # Lowest threshold first so higher ones overwrite
+        for threshold, label in reversed(STATUS_THRESHOLDS):
+            labels[totals >= threshold] = label
+        return labels
+
+    def _grow_locked(self):
+        capacity = len(self._start)
+        extra = max(1, capacity)
+        self._windows = np.concatenate([self._windows, np.zeros((extra,) + self._windows.shape[1:])])
+        self._start = np.concatenate([self._start, np.zeros(extra, dtype=np.int64)])
+        self._length = np.concatenate([self._length, np.zeros(extra, dtype=np.int64)])
+        self._free.extend(range(capacity + extra - 1, capacity - 1, -1))
+
+
+class _PendingScore:
+    def __init__(self, item):
+        self.item = item
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class ScoreBatcher:
+    """
+    Combines concurrent single-item requests into batched calls
+
+    Threads submit one item each. The first thread to find no batch in
+    progress becomes the leader: it takes every pending item (up to
+    max_batch), runs score_batch on them once, hands out the results and
+    repeats until its own item is done; then a waiting thread takes over.
+    A lone request is scored immediately, with no timer or added latency,
+    and under load each call covers every request that arrived meanwhile.
+
+    Args:
+        score_batch: Callable(list of items) -> list of results, in order
+        max_batch: Most items passed to one score_batch call
+    """
+
+    def __init__(self, score_batch, max_batch=256):
+        self.score_batch = score_batch
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._busy = False
+        self._cond = threading.Condition()
+
+    def submit(self, item):
+        """Score one item, possibly together with other threads' items"""
+        entry = _PendingScore(item)
+        with self._cond:
+            self._pending.append(entry)
+            while self._busy and not entry.done:
+                self._cond.wait()
+            if not entry.done:
+                self._busy = True
+        if not entry.done:
+            try:
+                while not entry.done:
+                    with self._cond:
+                        batch = self._pending[:self.max_batch]
+                        del self._pending[:self.max_batch]
+                    self._run(batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def _run(self, batch):
+        try:
+            results = self.score_batch([entry.item for entry in batch])
+        except Exception as e:
+            results, error = [None] * len(batch), e
+        else:
+            error = None
+        with self._cond:
+            self.batches += 1
+            self.items += len(batch)
+            for entry, result in zip(batch, results):
+                entry.result, entry.error, entry.done = result, error, True
+            self._cond.notify_all()
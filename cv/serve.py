@@ -0,0 +1,299 @@
+"""
+Production server for the cheating detection API
+
+A front router accepts HTTP requests and forwards each one to one of N
+worker processes. A session always lands on the same worker (CRC32 of
+its session ID), so that worker owns the session's FaceMesh tracking
+state and CheatingDetector histories. Workers execute the unchanged
+cheating_detector Flask views, so the HTTP API is identical to running
+cheating_detector.py directly. The /stream WebSocket (when flask-sock is
+installed) is terminated by the router, which drops stale frames the same
+way and forwards each remaining frame to the session's worker as a
+/process-frame request.
+
+Usage:
+    python serve.py --workers 4 --threads-per-worker 1 --pin-cpus
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import re
+import threading
+import zlib
+
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+
+from frame_slot import LatestFrameSlot
+from metrics import merge_expositions
+
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:  # WebSocket streaming is optional
+    Sock = None
+
+# Routes forwarded to the workers
+FORWARDED_ROUTES = [
+    ('/process-frame', ['POST']),
+    ('/process-frames', ['POST']),
+    ('/get-session-summary', ['GET']),
+    ('/reset-session', ['POST']),
+    ('/register-reference', ['POST']),
+    ('/remove-candidate', ['POST']),
+]
+
+# Hop-by-hop or recomputed headers that must not be copied between requests
+SKIPPED_HEADERS = {'content-length', 'transfer-encoding', 'connection', 'host'}
+
+
+def worker_main(index, conn, threads, cpus):
+    """Worker process: owns its sessions and serves forwarded requests one at a time"""
+    # Must be set before numpy/OpenCV/MediaPipe are imported in this process
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        # Bounds every thread of the process, including MediaPipe's own executors
+        os.sched_setaffinity(0, cpus)
+
+    import cv2
+    cv2.setNumThreads(threads)
+    import cheating_detector
+
+    app = cheating_detector.app
+    cheating_detector.metrics_registry.const_labels = {'worker': str(index)}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        method, path, query_string, headers, body = message
+        with app.test_request_context(path, method=method, query_string=query_string,
+                                      headers=headers, data=body):
+            response = app.full_dispatch_request()
+            conn.send((response.status_code, list(response.headers.items()), response.get_data()))
+    conn.close()
+
+
+class WorkerHandle:
+    """Router-side end of one worker process"""
+
+    def __init__(self, index, threads, cpus, ctx):
+        self.index = index
+        self.conn, child_conn = ctx.Pipe()
+        self.lock = threading.Lock()  # one request in flight per worker
+        self.process = ctx.Process(target=worker_main, args=(index, child_conn, threads, cpus),
+                                   name=f"proctor-worker-{index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def forward(self, method, path, query_string, headers, body):
+        with self.lock:
+            self.conn.send((method, path, query_string, headers, body))
+            return self.conn.recv()
+
+    def stop(self):
+        try:
+            with self.lock:
+                self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+
+
+class Router:
+    """Sticky session router in front of a pool of worker processes"""
+
+    def __init__(self, workers, threads_per_worker=1, pin_cpus=False):
+        ctx = mp.get_context('spawn')  # fresh interpreters: no inherited MediaPipe state
+        cpu_count = os.cpu_count() or 1
+        self.workers = []
+        for i in range(workers):
+            cpus = None
+            if pin_cpus:
+                cpus = {(i * threads_per_worker + j) % cpu_count for j in range(threads_per_worker)}
+            self.workers.append(WorkerHandle(i, threads_per_worker, cpus, ctx))
+
+    def worker_for(self, session_id):
+        return self.workers[zlib.crc32(session_id.encode('utf-8')) % len(self.workers)]
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+def multipart_field(body, boundary, name):
+    """
+    Value of a small text field in a multipart body, found by scanning the
+    raw bytes instead of parsing (and spooling) every file part
+    """
+    match = re.search(rb'name="' + re.escape(name.encode('ascii')) + rb'"\r\n(?:[^\r\n]*\r\n)*\r\n(.*?)\r\n--'
+                      + re.escape(boundary.encode('latin-1')), body, re.DOTALL)
+    return match.group(1).decode('utf-8', 'replace') if match else None
+
+
+def request_session_id(body):
+    """
+    Same lookup order as cheating_detector.get_session_id, without decoding
+    frames: the header or query string, and only then the cached body
+    """
+    session_id = request.headers.get('X-Session-ID') or request.args.get('session_id')
+    if not session_id:
+        if request.mimetype == 'multipart/form-data':
+            boundary = request.mimetype_params.get('boundary')
+            session_id = multipart_field(body, boundary, 'session_id') if boundary else None
+        elif request.is_json:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                session_id = data.get('session_id')
+    return str(session_id) if session_id else 'default'
+
+
+def stream_request(session_id, message):
+    """Turn a WebSocket message into the headers and body of a /process-frame request"""
+    headers = [('X-Session-ID', session_id)]
+    if isinstance(message, (bytes, bytearray)):
+        return headers + [('Content-Type', 'application/octet-stream')], bytes(message)
+    if not message.lstrip().startswith('{'):
+        message = json.dumps({'frame': message})
+    return headers + [('Content-Type', 'application/json')], message.encode('utf-8')
+
+
+def create_app(router):
+    app = Flask(__name__)
+    CORS(app)
+
+    @app.route('/health', methods=['GET'])
+    def health_check():
+        """Health check endpoint"""
+        alive = sum(1 for w in router.workers if w.process.is_alive())
+        return jsonify({"status": "ok" if alive == len(router.workers) else "degraded",
+                        "workers": len(router.workers), "workers_alive": alive})
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus metrics of every worker, labelled by worker index"""
+        texts = []
+        for worker in router.workers:
+            try:
+                status, _, data = worker.forward('GET', '/metrics', b'', [], b'')
+            except (EOFError, BrokenPipeError, OSError):
+                continue
+            if status == 200:
+                texts.append(data.decode('utf-8'))
+        return Response(merge_expositions(texts), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/impersonation-check', methods=['POST'])
+    def impersonation_check():
+        """Run the check on every worker and concatenate their sessions"""
+        body = request.get_data(cache=True)
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in SKIPPED_HEADERS]
+        report = []
+        for worker in router.workers:
+            try:
+                status, _, data = worker.forward('POST', '/impersonation-check', b'', headers, body)
+            except (EOFError, BrokenPipeError, OSError):
+                continue
+            if status != 200:
+                return Response(data, status=status, mimetype='application/json')
+            report.extend(json.loads(data)['sessions'])
+        return jsonify({"status": "success", "sessions": report})
+
+    def forward():
+        # Cache the raw body before any form/JSON parsing so it can be forwarded verbatim
+        body = request.get_data(cache=True)
+        worker = router.worker_for(request_session_id(body))
+        if not worker.process.is_alive():
+            return jsonify({"status": "error", "message": f"Worker {worker.index} is down"}), 503
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in SKIPPED_HEADERS]
+        try:
+            status, response_headers, data = worker.forward(
+                request.method, request.path, request.query_string, headers, body)
+        except (EOFError, BrokenPipeError, OSError):
+            return jsonify({"status": "error", "message": f"Worker {worker.index} is down"}), 503
+        response_headers = [(k, v) for k, v in response_headers if k.lower() not in SKIPPED_HEADERS]
+        return Response(data, status=status, headers=response_headers)
+
+    for rule, methods in FORWARDED_ROUTES:
+        app.add_url_rule(rule, endpoint=rule, view_func=forward, methods=methods)
+
+    if Sock is not None:
+        sock = Sock(app)
+
+        @sock.route('/stream')
+        def stream_frames(ws):
+            """
+            Stream frames for one session over a WebSocket
+
+            Mirrors cheating_detector's /stream: a reader thread parks
+            messages in a LatestFrameSlot, stale frames are dropped, and
+            each analyzed frame's result carries its sequence number and
+            the running drop count.
+            """
+            session_id = request.headers.get('X-Session-ID') or request.args.get('session_id') or 'default'
+            worker = router.worker_for(session_id)
+            slot = LatestFrameSlot()
+
+            def receive_frames():
+                try:
+                    while True:
+                        message = ws.receive()
+                        if message is None:
+                            break
+                        slot.put(message)
+                except ConnectionClosed:
+                    pass
+                finally:
+                    slot.close()
+
+            threading.Thread(target=receive_frames, daemon=True).start()
+
+            try:
+                while True:
+                    item = slot.get()
+                    if item is None:
+                        break
+                    seq, message = item
+                    headers, body = stream_request(session_id, message)
+                    try:
+                        status, _, data = worker.forward('POST', '/process-frame', b'', headers, body)
+                        result = json.loads(data)
+                        if status != 200:
+                            result = {"status": "error",
+                                      "message": result.get('error') or result.get('message')}
+                    except (EOFError, BrokenPipeError, OSError):
+                        result = {"status": "error", "message": f"Worker {worker.index} is down"}
+                    result["seq"] = seq
+                    result["dropped"] = slot.dropped
+                    ws.send(json.dumps(result))
+            except ConnectionClosed:
+                pass
+            finally:
+                slot.close()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-process cheating detection server')
+    parser.add_argument('--host', type=str, default='0.0.0.0')
+    parser.add_argument('--port', '-p', type=int, default=5000)
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--threads-per-worker', '-t', type=int, default=1,
+                        help='OpenCV/OpenMP threads per worker (default: 1)')
+    parser.add_argument('--pin-cpus', action='store_true',
+                        help='Pin each worker to its own CPU cores (Linux only)')
+    args = parser.parse_args()
+
+    router = Router(args.workers, args.threads_per_worker, args.pin_cpus)
+    try:
+        create_app(router).run(host=args.host, port=args.port, threaded=True)
+    finally:
+        router.stop()
+
+
+if __name__ == "__main__":
+    main()
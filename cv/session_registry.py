@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionState:
+    """Per-session detector state plus the lock that serializes its frames"""
+
+    def __init__(self, session_id, detector):
+        self.session_id = session_id
+        self.detector = detector
+        self.lock = threading.Lock()
+        self.created_at = time.monotonic()
+        self.last_seen = self.created_at
+
+        # Analysis state carried between frames by the server
+        self.motion_gate = None
+        self.last_metrics = None
+        self.roi_tracker = None
+        self.reverifier = None  # set once a reference photo is registered
+        self.candidate_id = None
+        self.frame_store = None  # FrameStoreWriter for per-frame metrics, if enabled
+        self.last_pose = None  # (head_angles, lip_distance) of the last analyzed face
+
+    def close(self):
+        """
+        Release per-session resources once the session is dropped
+
+        Waits for a frame still being analyzed, so the detector's resources
+        (e.g. its ScoringEngine slot) are never released mid-frame.
+        """
+        with self.lock:
+            if hasattr(self.detector, 'close'):
+                self.detector.close()
+            if self.frame_store is not None:
+                self.frame_store.close()
+
+
+class SessionRegistry:
+    """
+    Session ID -> SessionState map with TTL and LRU eviction
+
+    Args:
+        factory: Callable returning a fresh detector for a new session
+        max_sessions: Hard cap on live sessions; the least recently used is dropped
+        ttl: Seconds of inactivity after which a session is dropped
+        on_evict: Optional callback(session_id) run for every removed session,
+            after its SessionState.close()
+    """
+
+    def __init__(self, factory, max_sessions=256, ttl=900.0, on_evict=None):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._sessions = OrderedDict()  # session_id -> SessionState, oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def get(self, session_id):
+        """Return the live session or None, without creating it"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None:
+                state.last_seen = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return state
+
+    def get_or_create(self, session_id):
+        """Return the session, creating it (and evicting others) if needed"""
+        with self._lock:
+            now = time.monotonic()
+            evicted = self._evict_expired_locked(now)
+            state = self._sessions.get(session_id)
+            if state is None:
+                while len(self._sessions) >= self.max_sessions:
+                    evicted.append(self._sessions.popitem(last=False)[1])
+                state = SessionState(session_id, self.factory())
+                self._sessions[session_id] = state
+            else:
+                self._sessions.move_to_end(session_id)
+            state.last_seen = now
+        self._notify(evicted)
+        return state
+
+    def reset(self, session_id):
+        """Replace a session's detector with a fresh one"""
+        self.remove(session_id)
+        return self.get_or_create(session_id)
+
+    def remove(self, session_id):
+        """Drop a session; returns True if it existed"""
+        with self._lock:
+            state = self._sessions.pop(session_id, None)
+        if state is not None:
+            self._notify([state])
+        return state is not None
+
+    def evict_expired(self):
+        """Drop every session idle for longer than the TTL; returns their IDs"""
+        with self._lock:
+            evicted = self._evict_expired_locked(time.monotonic())
+        self._notify(evicted)
+        return [state.session_id for state in evicted]
+
+    def session_ids(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def states(self):
+        """Snapshot of the live sessions; unlike get(), does not refresh them"""
+        with self._lock:
+            return list(self._sessions.values())
+
+    def _evict_expired_locked(self, now):
+        evicted = []
+        for session_id, state in list(self._sessions.items()):
+            if now - state.last_seen <= self.ttl:
+                break  # entries are kept in LRU order
+            del self._sessions[session_id]
+            evicted.append(state)
+        return evicted
+
+    def _notify(self, states):
+        for state in states:
+            state.close()
+            if self.on_evict is not None:
+                self.on_evict(state.session_id)
@@ -0,0 +1,141 @@
+import math
+
+
+class P2Quantile:
+    """
+    P-squared streaming quantile estimator (Jain & Chlamtac, 1985)
+
+    Tracks one quantile with five markers, so memory and update cost are
+    constant however many values are observed. Exact for the first five
+    values.
+
+    Args:
+        p: Quantile to estimate, in (0, 1)
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []  # marker heights q[0..4]
+        self.positions = [0, 1, 2, 3, 4]  # actual marker positions n[0..4]
+        self.desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]  # desired positions n'[0..4]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        # Cell k containing x, extending the extremes if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers toward their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        """Current estimate, or None before the first value"""
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5:
+            # Nearest-rank quantile of the few values seen so far
+            return q[max(0, math.ceil(self.p * len(q)) - 1)]
+        return q[2]
+
+
+class StreamingStats:
+    """
+    Constant-memory aggregates of a stream of scores in [lo, hi]
+
+    Keeps count, sum, min/max, a fixed-bin histogram and P-squared
+    estimates of the requested quantiles. The sum is accumulated in
+    arrival order, so the mean equals sum(values) / len(values) over the
+    same values exactly.
+
+    Args:
+        bins: Number of equal-width histogram bins
+        lo: Lower edge of the histogram
+        hi: Upper edge of the histogram (values outside are clamped into the end bins)
+        quantiles: Quantiles to estimate
+    """
+
+    def __init__(self, bins=100, lo=0.0, hi=1.0, quantiles=(0.5, 0.95)):
+        self.lo = lo
+        self.hi = hi
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.histogram = [0] * bins
+        self._quantiles = {q: P2Quantile(q) for q in quantiles}
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+        bins = len(self.histogram)
+        index = int((value - self.lo) / (self.hi - self.lo) * bins)
+        self.histogram[min(max(index, 0), bins - 1)] += 1
+
+        for estimator in self._quantiles.values():
+            estimator.add(value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def distribution(self, buckets=None):
+        """
+        Histogram as [(lower, upper, count), ...], optionally merged into
+        `buckets` equal groups of bins (bins must be a multiple of buckets)
+        """
+        bins = len(self.histogram)
+        buckets = buckets or bins
+        if bins % buckets:
+            raise ValueError(f"{bins} bins cannot be merged into {buckets} buckets")
+        per_bucket = bins // buckets
+        width = (self.hi - self.lo) / buckets
+        return [(self.lo + i * width, self.lo + (i + 1) * width,
+                 sum(self.histogram[i * per_bucket:(i + 1) * per_bucket]))
+                for i in range(buckets)]
+
+    def quantile(self, q):
+        """Estimate of a quantile passed to the constructor"""
+        return self._quantiles[q].value()
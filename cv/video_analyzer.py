@@ -0,0 +1,252 @@
+"""
+Offline analyzer for recorded exam videos
+
+Runs the same FaceMesh + head pose / mouth / eye gaze pipelines as the live
+server over recorded video files and scores them with CheatingDetector.
+Long videos are cut into time chunks analyzed on a process pool. Chunks only
+produce per-frame analyzer outputs; scoring then replays the frames in
+order with one detector per video, so the smoothing histories and
+face-absence timing run across chunk boundaries exactly as in one
+sequential pass. A video is scored chunk by chunk as soon as its chunks
+finish, and its outputs are streamed to disk, so memory does not grow with
+the recording length.
+
+Usage:
+    python video_analyzer.py exam1.mp4 exam2.mp4 --chunk-seconds 120 --workers 8
+"""
+import argparse
+import csv
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from g_helper import bgr2rgb, mirrorImage
+from fp_helper import pipelineHeadTiltPose
+from ms_helper import pipelineMouthState
+from eg_helper import pipelineEyeGaze
+from frame_context import FrameContext
+from frame_store import FrameStoreWriter, frame_record
+from mesh_pool import FACE_MESH_OPTIONS, mp_face_mesh
+
+# Columns of the per-frame metrics CSV
+FRAME_FIELDS = [
+    'frame', 'timestamp', 'num_faces', 'head_tilt', 'pitch', 'yaw', 'roll',
+    'mouth_state', 'lip_distance', 'gaze_direction', 'out_of_screen',
+    'l_x_ratio', 'l_y_ratio', 'r_x_ratio', 'r_y_ratio', 'avg_x_ratio', 'avg_y_ratio',
+    'gaze_score', 'head_score', 'mouth_score', 'face_score', 'score', 'risk_level', 'status',
+]
+
+
+def probe_video(path):
+    """Return (fps, frame_count) of a video file"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video '{path}'")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return fps, frame_count
+
+
+def analyze_chunk(path, start, end, fps, step, mirror):
+    """
+    Run FaceMesh and the analyzers over frames [start, end) of a video
+
+    Returns:
+        List of per-frame dicts with the raw analyzer outputs (no scoring)
+    """
+    cap = cv2.VideoCapture(path)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    records = []
+    with mp_face_mesh.FaceMesh(**FACE_MESH_OPTIONS) as face_mesh:
+        for index in range(start, end):
+            # grab() skips decoding frames that are not sampled
+            if not cap.grab():
+                break
+            if index % step:
+                continue
+            success, frame = cap.retrieve()
+            if not success:
+                continue
+            if mirror:
+                frame = mirrorImage(frame)
+
+            results = face_mesh.process(bgr2rgb(frame))
+            faces = results.multi_face_landmarks or []
+            record = {'frame': index, 'timestamp': index / fps, 'num_faces': len(faces)}
+            if faces:
+                ctx = FrameContext(faces[0], frame.shape)
+                record['head_tilt'] = pipelineHeadTiltPose(frame, ctx, draw=False)
+                record['mouth_state'] = pipelineMouthState(frame, ctx, draw=False)
+                record['gaze_info'] = pipelineEyeGaze(frame, ctx, draw=False)
+                record['head_angles'] = ctx.head_angles
+                record['lip_distance'] = ctx.lip_distance
+            records.append(record)
+    cap.release()
+    return records
+
+
+def plan_chunks(frame_count, fps, chunk_seconds):
+    """Split [0, frame_count) into chunks of roughly chunk_seconds"""
+    if frame_count <= 0:
+        # Unknown length (some containers): read the whole video in one chunk
+        return [(0, 2 ** 62)]
+    chunk_frames = max(1, int(round(chunk_seconds * fps)))
+    return [(start, min(start + chunk_frames, frame_count))
+            for start in range(0, frame_count, chunk_frames)]
+
+
+def frame_row(record, result, detector):
+    """Per-frame CSV row from a record, its score result and the detector state"""
+    row = {
+        'frame': record['frame'],
+        'timestamp': f"{record['timestamp']:.3f}",
+        'num_faces': record['num_faces'],
+        'score': f"{result['score']:.4f}",
+        'risk_level': result['risk_level'],
+        'status': result['status'],
+    }
+    if record['num_faces']:
+        gaze_info = record['gaze_info']
+        pitch, yaw, roll = record['head_angles']
+        row.update({
+            'head_tilt': record['head_tilt'],
+            'pitch': f"{pitch:.2f}", 'yaw': f"{yaw:.2f}", 'roll': f"{roll:.2f}",
+            'mouth_state': record['mouth_state'],
+            'lip_distance': record['lip_distance'],
+            'gaze_direction': gaze_info['direction'],
+            'out_of_screen': int(gaze_info['out_of_screen']),
+        })
+        for key in ('l_x_ratio', 'l_y_ratio', 'r_x_ratio', 'r_y_ratio', 'avg_x_ratio', 'avg_y_ratio'):
+            row[key] = f"{gaze_info[key]:.4f}"
+    if result['status'] == 'success':
+        gaze, head, mouth, face = detector.last_components
+        row.update({'gaze_score': f"{gaze:.4f}", 'head_score': f"{head:.4f}",
+                    'mouth_score': f"{mouth:.4f}", 'face_score': f"{face:.4f}"})
+    return row
+
+
+def output_names(paths):
+    """
+    Base name of each video's outputs: the file name without extension,
+    plus a hash of the full path when two inputs share a file name
+    (a/exam.mp4 and b/exam.mp4)
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    return [stem if stems.count(stem) == 1
+            else f"{stem}-{hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]}"
+            for path, stem in zip(paths, stems)]
+
+
+def score_video(futures, fps, out_dir, name):
+    """
+    Score a video's chunks in order as they finish and stream the outputs
+
+    Each chunk's records are scored, written and released before the next
+    chunk is read, so memory stays bounded by the chunks not yet scored.
+    Writes <name>_summary.txt, <name>_frames.csv and <name>_frames.frames
+    (see frame_store); on failure the partial outputs are removed.
+
+    Args:
+        futures: analyze_chunk futures in frame order (consumed)
+
+    Returns:
+        (frames_scored, summary_path, csv_path, store_path)
+    """
+    # Imported lazily: only the scoring step needs the server module
+    from cheating_detector import CheatingDetector, score_frame
+
+    os.makedirs(out_dir, exist_ok=True)
+    summary_path = os.path.join(out_dir, f"{name}_summary.txt")
+    frames_path = os.path.join(out_dir, f"{name}_frames.csv")
+    store_path = os.path.join(out_dir, f"{name}_frames.frames")
+    if os.path.exists(store_path):
+        os.remove(store_path)  # the writer appends; a rerun starts over
+
+    detector = CheatingDetector()
+    scored = 0
+    last_frame = -1
+    store = FrameStoreWriter(store_path, batch_size=4096)
+    try:
+        with open(frames_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FRAME_FIELDS)
+            writer.writeheader()
+            for i, future in enumerate(futures):
+                records = future.result()
+                futures[i] = None  # drop the finished chunk's records once scored
+                for record in records:
+                    result = score_frame(detector, record['num_faces'], record['timestamp'],
+                                         record.get('head_tilt'), record.get('mouth_state'),
+                                         record.get('gaze_info'))
+                    writer.writerow(frame_row(record, result, detector))
+                    store.append(frame_record(record['timestamp'], record['num_faces'], result,
+                                              record.get('gaze_info'), record.get('head_angles'),
+                                              record.get('lip_distance'), detector.last_components))
+                    last_frame = record['frame']
+                    scored += 1
+        store.close()
+
+        duration = (last_frame + 1) / fps if scored else 0.0
+        with open(summary_path, 'w') as f:
+            f.write(detector.get_session_summary(duration=duration))
+    except BaseException:
+        store.close()
+        for path in (summary_path, frames_path, store_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return scored, summary_path, frames_path, store_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze recorded exam videos for suspicious behavior')
+    parser.add_argument('videos', nargs='+', help='Video files to analyze')
+    parser.add_argument('--out-dir', '-o', type=str, default='video_reports',
+                        help='Directory for summaries and per-frame metrics (default: video_reports)')
+    parser.add_argument('--chunk-seconds', type=float, default=120.0,
+                        help='Length of the chunks analyzed in parallel (default: 120)')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--sample-fps', type=float, default=None,
+                        help='Analyze at most this many frames per second (default: every frame)')
+    parser.add_argument('--no-mirror', action='store_true',
+                        help='Do not mirror frames (the live pipelines mirror webcam frames)')
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # Submit every chunk of every video up front so the pool stays busy
+        jobs = []
+        for path in args.videos:
+            try:
+                fps, frame_count = probe_video(path)
+            except IOError as e:
+                print(f"Error: {e}")
+                continue
+            step = max(1, int(round(fps / args.sample_fps))) if args.sample_fps else 1
+            futures = [pool.submit(analyze_chunk, path, start, end, fps, step, not args.no_mirror)
+                       for start, end in plan_chunks(frame_count, fps, args.chunk_seconds)]
+            jobs.append((path, fps, futures))
+
+        # Each video is scored as soon as its chunks finish, while later
+        # videos' chunks keep running; a failing video does not stop the rest
+        names = output_names([path for path, _, _ in jobs])
+        for (path, fps, futures), name in zip(jobs, names):
+            try:
+                scored, summary_path, frames_path, store_path = score_video(futures, fps, args.out_dir, name)
+            except Exception as e:
+                for future in futures:
+                    if future is not None:
+                        future.cancel()
+                print(f"Error: {path}: analysis failed: {e}")
+                continue
+            print(f"{path}: {scored} frames analyzed")
+            print(f"  Summary: {summary_path}")
+            print(f"  Per-frame metrics: {frames_path} ({store_path})")
+
+
+if __name__ == "__main__":
+    main()